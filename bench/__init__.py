@@ -0,0 +1 @@
+"""Offline benchmarks of the crawler, run from the project root: python -m bench.<name> --help"""
@@ -0,0 +1,108 @@
+"""End to end crawl benchmark against the local stand-in server.
+
+Every run is a full HiddenStreet refresh (discover, fetch, parse, ingest)
+into a throwaway database, reporting pages/s, parse ms/page, ingest rows/s
+and peak RSS. Runs after the first reuse the HTTP cache and the database of
+the previous ones, unless --cold is given.
+
+    python -m bench.crawl --servers bbb,gms --pages 5 --latency 0.05 --runs 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import settings
+from .standin import StandIn
+
+
+def peak_rss() -> tuple:
+    """Peak resident set size in MiB of this process and of its waited for children (the parser processes)"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return tuple(resource.getrusage(who).ru_maxrss / scale
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def run_once(loop, run: int) -> dict:
+    from crawlers.hiddenstreet import HiddenStreet
+
+    hiddenstreet = HiddenStreet(loop)
+    start = time.monotonic()
+    try:
+        loop.run_until_complete(hiddenstreet.refresh())
+    finally:
+        if hiddenstreet.executor is not None:
+            hiddenstreet.executor.shutdown(wait=True)
+            hiddenstreet.executor = None
+        hiddenstreet.close()
+    elapsed = time.monotonic() - start
+
+    pipeline = hiddenstreet.pipeline
+    rows = sum(hiddenstreet.throughput.rows.values())
+    rss, children_rss = peak_rss()
+    return dict(run=run,
+                seconds=round(elapsed, 3),
+                pages=pipeline.counters['fetch'],
+                errors=sum(v for k, v in pipeline.counters.items() if k.endswith('errors')),
+                rows=rows,
+                pages_per_second=round(pipeline.counters['fetch'] / elapsed, 1),
+                parse_ms_per_page=round(pipeline.busy['parse'] * 1000 / max(1, pipeline.counters['parse']), 2),
+                ingest_rows_per_second=round(rows / max(1e-6, pipeline.busy['ingest']), 1),
+                peak_rss_mib=round(rss, 1),
+                peak_children_rss_mib=round(children_rss, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--servers', default='bbb,gms', help="comma separated, '' for every server")
+    parser.add_argument('--pages', type=int, help='pages of every listing (default: as many as saved)')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response time in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of requests answered with a 503')
+    parser.add_argument('--parser', choices=('bs4', 'lxml', 'compiled'), default=settings.PARSER_BACKEND)
+    parser.add_argument('--processes', type=int, default=settings.PARSER_PROCESSES,
+                        help='parser processes, 0 parses on the event loop')
+    parser.add_argument('--cold', action='store_true', help='start every run with an empty cache and database')
+    parser.add_argument('--json', action='store_true', help='print results as json lines')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    loop = asyncio.get_event_loop()
+    standin = StandIn(loop, pages=args.pages, latency=args.latency, error_rate=args.error_rate, seed=0)
+    from crawlers.hiddenstreet import HiddenStreet
+    HiddenStreet.base_url, HiddenStreet.base_url_bbb = loop.run_until_complete(standin.start())
+
+    settings.CRAWL_SERVERS = [s for s in args.servers.split(',') if s]
+    settings.PARSER_BACKEND = args.parser
+    settings.PARSER_PROCESSES = args.processes
+    settings.HTTP_CACHE_MAX_AGE = 0  # always revalidate, as a periodic refresh would
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ironbot-bench-') as workdir:
+        for run in range(1, args.runs + 1):
+            rundir = os.path.join(workdir, str(run) if args.cold else 'shared')
+            settings.HTTP_CACHE_DIR = os.path.join(rundir, 'cache')
+            settings.DATABASE_PATH = os.path.join(rundir, 'ironbot.sqlite3')
+            os.makedirs(rundir, exist_ok=True)
+            result = run_once(loop, run)
+            results.append(result)
+            if args.json:
+                print(json.dumps(result, sort_keys=True))
+            else:
+                print('run {run}: {pages} pages ({errors} errors), {rows} rows in {seconds:.2f}s | '
+                      '{pages_per_second} pages/s, parse {parse_ms_per_page} ms/page, '
+                      'ingest {ingest_rows_per_second} rows/s | '
+                      'peak RSS {peak_rss_mib} MiB (parsers {peak_children_rss_mib} MiB)'.format(**result))
+
+    loop.run_until_complete(standin.close())
+    loop.close()
+    return results
+
+
+if __name__ == '__main__':
+    main()
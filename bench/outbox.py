@@ -0,0 +1,107 @@
+"""Benchmark of the replies of commands: a message per reply against the outbox.
+
+A fake client stands in for Discord, answering after --latency and
+throttling channels the way Discord does (5 messages every 5 seconds),
+a throttled message being sent again after the wait, as discord.py does.
+Every scenario is run once sending each reply and awaiting it, as the
+commands used to, and once through the outbox (commons/outbox.py),
+reporting the messages sent, the throttled attempts and the time until
+the last reply arrives. Times are multiplied by --scale, to keep the
+runs short.
+
+    python -m bench.outbox --latency 0.1 --scale 0.1
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from commons import messages
+from commons.messages import get as msg
+from commons.outbox import MESSAGE_LIMIT, Outbox
+from commons.ratelimit import TokenBucket
+from crawlers.mapleweapons import Catalogue
+
+CHANNEL_RATE = 5  # messages every CHANNEL_PER seconds in a channel
+CHANNEL_PER = 5
+
+
+class FakeClient:
+    """send_message of a Discord client, counting the messages sent and throttled by channel"""
+
+    def __init__(self, loop, latency: float, scale: float):
+        self.loop = loop
+        self.latency = latency * scale
+        self.scale = scale
+        self.buckets = {}
+        self.counters = Counter()
+
+    @asyncio.coroutine
+    def send_message(self, destination, content: str):
+        assert len(content) <= MESSAGE_LIMIT, 'message too long'
+        bucket = self.buckets.setdefault(destination, TokenBucket(CHANNEL_RATE, CHANNEL_PER * self.scale))
+        while True:
+            yield from asyncio.sleep(self.latency, loop=self.loop)
+            if bucket.take():
+                self.counters['messages'] += 1
+                return
+            self.counters['throttled'] += 1
+            yield from asyncio.sleep(bucket.delay(), loop=self.loop)
+
+
+def maplelist(weapon_level: int=None, max_level: int=None) -> list:
+    return [msg('maple_list_info.result').format(required_level=w.required_level, names=w.names)
+            for w in Catalogue.load().levels(weapon_level, max_level)]
+
+
+# name, replies of every command run at the same time in a channel
+SCENARIOS = [
+    ('maplelist', lambda: [maplelist()]),
+    ('repeat 5', lambda: [['bla bla'] * 5]),
+    ('4 x maplelist 35 64', lambda: [maplelist(35, 64)] * 4),
+]
+
+
+@asyncio.coroutine
+def awaiting(client: FakeClient, outbox: Outbox, replies: list):
+    for reply in replies:
+        yield from client.send_message('channel', reply)
+
+
+@asyncio.coroutine
+def queued(client: FakeClient, outbox: Outbox, replies: list):
+    for reply in replies:
+        outbox.put('channel', reply)
+    yield from outbox.flush()
+
+
+def run(loop, mode, commands: list, latency: float, scale: float) -> dict:
+    client = FakeClient(loop, latency, scale)
+    outbox = Outbox(client.send_message, loop, rate=CHANNEL_RATE, per=CHANNEL_PER * scale)
+    start = time.perf_counter()
+    loop.run_until_complete(asyncio.gather(*[mode(client, outbox, replies) for replies in commands], loop=loop))
+    return dict(replies=sum(map(len, commands)), messages=client.counters['messages'],
+                throttled=client.counters['throttled'], seconds=(time.perf_counter() - start) / scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--latency', type=float, default=0.1, help='time in seconds Discord takes to answer')
+    parser.add_argument('--scale', type=float, default=0.1, help='multiplies every time, reported times are not')
+    args = parser.parse_args()
+
+    messages.initialize()
+    loop = asyncio.new_event_loop()
+    try:
+        print('{:<20} {:<8} {:>8} {:>9} {:>10} {:>8}'.format('scenario', 'sender', 'replies', 'messages',
+                                                             'throttled', 'seconds'))
+        for scenario, commands in SCENARIOS:
+            for name, mode in (('await', awaiting), ('outbox', queued)):
+                result = run(loop, mode, commands(), args.latency, args.scale)
+                print('{:<20} {:<8} {replies:>8} {messages:>9} {throttled:>10} {seconds:>8.2f}'.format(
+                    scenario, name, **result))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Micro-benchmark of the row parsers, with regression thresholds.
+
+The tables of the pages in bench/corpus are parsed once per backend, then
+convert() and the parse_*_tag functions (the extraction plans for the
+compiled backend) are timed over them, reporting µs/row (µs/call for
+convert) and the memory allocated per row. Timings are the best of
+--rounds rounds of --repeat passes, scaled by the median of calibration
+runs made between rounds. Results are
+compared with bench/parsers_baseline.json and the run fails when a function
+got slower (or allocates more) than the baseline by more than --threshold.
+Every backend must also produce the very same rows as the BeautifulSoup one.
+
+    python -m bench.parsers                  # compare with the baseline
+    python -m bench.parsers --save-baseline  # after a deliberate change, on the reference machine
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from bs4 import BeautifulSoup
+from lxml import etree
+import settings
+from crawlers import extractor, hiddenstreet, lxmlparser
+from entities.enums import Server, WeaponType
+from entities.models import Monster, Weapon
+from .standin import CORPUS_DIR
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'parsers_baseline.json')
+
+# what each kind of saved page holds
+KINDS = {
+    'bbb-monster': (Server.BEFORE_BIG_BANG, Monster, None),
+    'monster': (Server.GLOBAL, Monster, None),
+    'weapon': (Server.GLOBAL, Weapon, WeaponType.STAFF)
+}
+
+
+def _bs4_tables(page: str, server: Server) -> list:
+    soup = BeautifulSoup(page, settings.BF4_PARSER)
+    return soup.find_all('table', class_='monster' if server == Server.BEFORE_BIG_BANG else 'database-info')
+
+
+def _lxml_tables(page: str, server: Server) -> list:
+    root = etree.fromstring(page.encode('utf-8'), lxmlparser._parser)
+    return lxmlparser.tables[server if server == Server.BEFORE_BIG_BANG else None](root)
+
+
+def _tag_workloads(module, tables, corpus: list) -> dict:
+    """Workloads of a backend made of per table functions (module.parse_funcs), calling module.convert.
+    convert() gets the arguments the parse functions call it with"""
+    convert = module.convert
+    calls = {'convert': (convert, [], 0)}
+
+    def recording_convert(*args):
+        calls['convert'][1].append(args)
+        return convert(*args)
+
+    module.convert = recording_convert
+    try:
+        for kind, page in corpus:
+            server, model, category = KINDS[kind]
+            func = module.parse_funcs[(server, model)]
+            for tag in tables(page, server):
+                calls.setdefault(func.__name__, (func, [], 0))[1].append((tag, category))
+                func(tag, category)
+    finally:
+        module.convert = convert
+    return {name: (func, args, len(args)) for name, (func, args, _) in calls.items()}
+
+
+def _plan_workloads(corpus: list) -> dict:
+    """Workloads of the compiled backend, one call per page extracting all of its rows"""
+    calls = {}
+    for kind, page in corpus:
+        server, model, category = KINDS[kind]
+        tables = _lxml_tables(page, server)
+        func, args, rows = calls.get(kind, (extractor.plan_for(server, model).extract, [], 0))
+        calls[kind] = (func, args + [(tables, category)], rows + len(tables))
+    return {'extract.{}'.format(kind): workload for kind, workload in calls.items()}
+
+
+Backend = namedtuple('Backend', ('parse_page', 'workloads'))
+
+# workloads(corpus) -> {function name: (function, list of argument tuples, rows), the tables being parsed in advance}
+backends = {
+    'bs4': Backend(hiddenstreet.parse_page, lambda corpus: _tag_workloads(hiddenstreet, _bs4_tables, corpus)),
+    'lxml': Backend(lxmlparser.parse_page, lambda corpus: _tag_workloads(lxmlparser, _lxml_tables, corpus)),
+    'compiled': Backend(extractor.parse_page, _plan_workloads)
+}
+
+
+def load_corpus() -> list:
+    """(kind, page) for every saved page"""
+    corpus = []
+    for kind in sorted(KINDS):
+        directory = os.path.join(CORPUS_DIR, kind)
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                corpus.append((kind, f.read()))
+    return corpus
+
+
+def dump_rows(rows: list) -> bytes:
+    return json.dumps(rows, sort_keys=True).encode('utf-8')
+
+
+def check_identical(corpus: list, names: list) -> list:
+    """Names of the backends whose rows differ from the BeautifulSoup ones, on any page"""
+    different = []
+    for name in names:
+        for kind, page in corpus:
+            server, model, category = KINDS[kind]
+            expected = dump_rows(backends['bs4'].parse_page(page, server, model, category))
+            if dump_rows(backends[name].parse_page(page, server, model, category)) != expected:
+                different.append(name)
+                break
+    return different
+
+
+def time_per_row(func, calls: list, rows: int, repeat: int) -> float:
+    """µs per row of the best of repeat passes over calls"""
+    best = float('inf')
+    gc.disable()  # as timeit does, collections would land on random passes
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for args in calls:
+                func(*args)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best / rows * 1e6
+
+
+def bytes_per_row(func, calls: list, rows: int) -> int:
+    tracemalloc.start()
+    try:
+        results = [func(*args) for args in calls]
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+    return round(peak / rows)
+
+
+def calibrate(repeat: int) -> float:
+    """µs taken by a fixed pure Python loop, telling how fast this machine is right now"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sorted(str(i * 7919 % 10007) for i in range(20000))
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def run(names: list, repeat: int, rounds: int) -> tuple:
+    """Results by function and the calibration of the machine. Functions are timed in rounds, each one
+    followed by a calibration, and the best timing of every function counts against the median
+    calibration, so that a burst of load on the machine hits at most a round"""
+    corpus = load_corpus()
+    workloads = {}
+    for name in names:
+        for func_name, workload in backends[name].workloads(corpus).items():
+            workloads['{}.{}'.format(name, func_name)] = workload
+
+    results = {key: dict(rows=rows, bytes_per_row=bytes_per_row(func, calls, rows), us_per_row=float('inf'))
+               for key, (func, calls, rows) in workloads.items()}
+    calibrations = [calibrate(repeat)]
+    for _ in range(rounds):
+        for key, (func, calls, rows) in sorted(workloads.items()):
+            results[key]['us_per_row'] = min(results[key]['us_per_row'], time_per_row(func, calls, rows, repeat))
+        calibrations.append(calibrate(repeat))
+
+    for result in results.values():
+        result['us_per_row'] = round(result['us_per_row'], 2)
+    return results, round(statistics.median(calibrations), 2)
+
+
+def regressions(results: dict, baseline: dict, threshold: float, speed: float=1.0) -> list:
+    """Metrics over the baseline by more than threshold, timings being scaled by speed (baseline
+    calibration / current calibration) so that a slower or busier machine is not taken for a regression"""
+    found = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for metric, scale in (('us_per_row', speed), ('bytes_per_row', 1.0)):
+            value = result[metric] * scale
+            if value > baseline[key][metric] * (1 + threshold):
+                found.append('{} {}: {:.2f} > {} (+{:.0%})'.format(key, metric, value, baseline[key][metric],
+                                                                   value / baseline[key][metric] - 1))
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default=','.join(sorted(backends)), help='comma separated backends to measure')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes over the corpus per round')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds of timings, the best pass of all counts')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='tolerated slowdown over the baseline, timings of unchanged code vary by up to 35%%')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+    names = args.backend.split(',')
+
+    different = check_identical(load_corpus(), names)
+    for name in different:
+        print('{}: rows differ from the bs4 ones'.format(name))
+
+    results, calibration = run(names, args.repeat, args.rounds)
+    baseline = {}
+    if os.path.isfile(BASELINE):
+        with open(BASELINE, encoding='utf-8') as f:
+            baseline = json.load(f)
+    speed = baseline.get('calibration_us', calibration) / calibration
+    print('calibration {:.0f}us (baseline machine speed x{:.2f})'.format(calibration, speed))
+
+    print('{:<35} {:>6} {:>10} {:>10} {:>12}'.format('function', 'rows', 'us/row', 'baseline', 'bytes/row'))
+    for key, result in sorted(results.items()):
+        print('{:<35} {rows:>6} {us_per_row:>10.2f} {:>10} {bytes_per_row:>12}'.format(
+            key, baseline.get(key, {}).get('us_per_row', '-'), **result))
+
+    if args.save_baseline:
+        if speed != 1.0:
+            # keep a single reference machine for the whole file
+            results = {key: dict(result, us_per_row=round(result['us_per_row'] * speed, 2))
+                       for key, result in results.items()}
+        baseline.setdefault('calibration_us', calibration)
+        baseline.update(results)
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline saved to {}'.format(BASELINE))
+        return 1 if different else 0
+
+    found = regressions(results, baseline, args.threshold, speed)
+    for regression in found:
+        print('REGRESSION {}'.format(regression))
+    return 1 if found or different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
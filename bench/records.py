@@ -0,0 +1,115 @@
+"""Benchmark of the query results: peewee model instances against read only records.
+
+The monsters in bench/corpus are parsed and ingested in a throwaway
+database, copied over until there are --rows of them, then every query is
+run once returning model instances (as HiddenStreet used to) and once
+returning records (entities/records.py), reporting µs/query and the bytes
+the results of a query keep alive.
+
+    python -m bench.records --rows 5000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from crawlers import extractor
+from crawlers.ingest import Ingestor
+from entities.enums import Server
+from entities.models import bind, create_search_indexes, match_expression, open_database, search, Monster
+from entities.records import records
+from .parsers import load_corpus
+
+
+def search_models(name: str) -> list:
+    """search() as it was, returning model instances"""
+    return list(Monster.raw('SELECT t.* FROM monster_fts JOIN monster AS t ON t.id_monster = monster_fts.rowid '
+                            'WHERE monster_fts MATCH ? ORDER BY bm25(monster_fts), t.name', match_expression(name)))
+
+
+# name, model instances, records. Every function takes the name part of a query
+QUERIES = [
+    ('exact name',
+     lambda name: list(Monster.select().where((Monster.name ** name) & (Monster.server == 'bbb') &
+                                              (Monster.deleted == False))),
+     lambda name: records(Monster.select().where((Monster.name ** name) & (Monster.server == 'bbb') &
+                                                 (Monster.deleted == False)))),
+    ('name search',
+     search_models,
+     lambda name: search(Monster, name)),
+    ('whole table',
+     lambda name: list(Monster.select()),
+     lambda name: records(Monster.select())),
+]
+
+
+def corpus_rows() -> list:
+    rows = []
+    for kind, page in load_corpus():
+        if kind == 'bbb-monster':
+            rows += [dict(row, server=Server.BEFORE_BIG_BANG.value)
+                     for row in extractor.parse_page(page, Server.BEFORE_BIG_BANG, Monster)]
+    return rows
+
+
+def populate(db, count: int) -> list:
+    """Ingests count monsters, returning the names to query"""
+    saved = corpus_rows()
+    rows = []
+    for i in range(count):
+        row = saved[i % len(saved)]
+        copy = i // len(saved)
+        rows.append(dict(row, hiddenstreet_alias='{}-{}'.format(row['hiddenstreet_alias'], copy),
+                         name=row['name'] if copy == 0 else '{} {}'.format(row['name'], copy)))
+    Ingestor(db, max_bulk_rows=200).ingest(Monster, rows)
+    return [row['name'] for row in saved]
+
+
+def measure(func, names: list, repeat: int) -> dict:
+    best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for name in names:
+                func(name)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        results = [func(name) for name in names]
+        kept = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    rows = sum(len(result) for result in results)
+    return dict(us_per_query=round(best / len(names) * 1e6, 1),
+                bytes_per_row=round(kept / max(1, rows)),
+                rows_per_query=round(rows / len(names), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000, help='monsters in the database')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes, the best one counts')
+    args = parser.parse_args()
+
+    db = open_database(':memory:')
+    with bind(db, [Monster]):
+        db.create_tables([Monster])
+        create_search_indexes(db, [Monster])
+        names = populate(db, args.rows)
+
+        print('{:<12} {:<8} {:>10} {:>10} {:>12}'.format('query', 'results', 'rows', 'us/query', 'bytes/row'))
+        for query, *funcs in QUERIES:
+            # the whole table once is enough
+            queried = names[:1] if query == 'whole table' else names
+            for kind, func in zip(('models', 'records'), funcs):
+                result = measure(func, queried, args.repeat)
+                print('{:<12} {:<8} {rows_per_query:>10} {us_per_query:>10.1f} {bytes_per_row:>12}'.format(
+                    query, kind, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Local stand-in for hidden-street.net, serving the pages in bench/corpus.
+
+Every monster or weapon listing the crawler asks for is answered with one of
+the saved pages of the same kind. Row aliases are made unique per listing
+and page, so that a crawl ingests distinct rows. Latency, errors and the
+number of pages of every listing can be set, to see how the crawler copes.
+
+    python -m bench.standin --pages 5 --latency 0.2 --error-rate 0.05
+
+then run the bot with HIDDENSTREET_URL and HIDDENSTREET_BBB_URL pointing to
+the two printed addresses.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+from aiohttp import web
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+log = logging.getLogger('standin')
+
+_pager = re.compile(r'<div class="item-list"><ul class="pager">.*?</ul></div>', re.DOTALL)
+_aliases = (re.compile(r'(<table class="monster" id=")([^"]+)'),
+            re.compile(r'(<a href="/[a-z]+/(?:monster|equipment/weapon)/)([^"]+)'))
+
+
+def pager(path: str, page: int, last: int) -> str:
+    """Drupal pager of the listing at path, as rendered on page"""
+    if last == 0:
+        return ''
+    items = []
+    if page > 0:
+        items.append('<li class="pager-first first"><a href="{}">« first</a></li>'.format(path))
+    for p in range(last + 1):
+        if p == page:
+            items.append('<li class="pager-current">{}</li>'.format(p + 1))
+        else:
+            items.append('<li class="pager-item"><a href="{}?page={}">{}</a></li>'.format(path, p, p + 1))
+    if page < last:
+        items.append('<li class="pager-next"><a href="{}?page={}">next ›</a></li>'.format(path, page + 1))
+        items.append('<li class="pager-last last"><a href="{}?page={}">last »</a></li>'.format(path, last))
+    return '<div class="item-list"><ul class="pager">{}</ul></div>'.format(''.join(items))
+
+
+class StandIn:
+    """Two aiohttp sites, one for www.hidden-street.net and one for bbb.hidden-street.net"""
+
+    def __init__(self, loop, corpus: str=CORPUS_DIR, pages: int=None, latency: float=0.0, error_rate: float=0.0,
+                 seed: int=None):
+        self.loop = loop
+        self.pages = pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.corpus = {}
+        for kind in os.listdir(corpus):
+            files = sorted(os.listdir(os.path.join(corpus, kind)), key=lambda name: int(name.split('.')[0]))
+            self.corpus[kind] = []
+            for name in files:
+                with open(os.path.join(corpus, kind, name), encoding='utf-8') as f:
+                    self.corpus[kind].append(_pager.sub('', f.read()))
+        self._servers = []
+        self._handlers = []
+
+    @staticmethod
+    def kind(path: list, bbb: bool):
+        if bbb:
+            return 'bbb-monster' if len(path) == 2 and path[0] == 'monster' else None
+        if len(path) == 3 and path[1] == 'monster':
+            return 'monster'
+        if len(path) == 4 and path[1:3] == ['equipment', 'weapon']:
+            return 'weapon'
+
+    def render(self, kind: str, path: str, page: int) -> str:
+        saved = self.corpus[kind]
+        last = (self.pages if self.pages is not None else len(saved)) - 1
+        if page > last:
+            return None
+        suffix = '{}-{}'.format(path.strip('/').replace('/', '-'), page)
+        body = saved[page % len(saved)]
+        for alias in _aliases:
+            body = alias.sub(lambda m: '{}{}-{}'.format(m.group(1), m.group(2), suffix), body)
+        return body.replace('</div></div>\n</body>', '{}</div></div>\n</body>'.format(pager(path, page, last)))
+
+    def handler(self, bbb: bool):
+        @asyncio.coroutine
+        def handle(request):
+            self.requests += 1
+            if self.latency:
+                yield from asyncio.sleep(self.random.uniform(self.latency / 2, self.latency * 1.5), loop=self.loop)
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return web.Response(status=503, text='Service Unavailable')
+
+            kind = self.kind(request.path.strip('/').split('/'), bbb)
+            try:
+                page = int(request.query.get('page', 0))
+            except ValueError:
+                page = None
+            body = None if kind is None or page is None else self.render(kind, request.path, page)
+            if body is None:
+                return web.Response(status=404, text='Not Found')
+            return web.Response(text=body, content_type='text/html')
+        return handle
+
+    @asyncio.coroutine
+    def start(self, host: str='127.0.0.1', port: int=0):
+        """Starts both sites, returning their base URLs (www first, then bbb)"""
+        urls = []
+        for bbb in (False, True):
+            app = web.Application(loop=self.loop)
+            app.router.add_get('/{path:.*}', self.handler(bbb))
+            handler = app.make_handler(access_log=None)
+            server = yield from self.loop.create_server(handler, host, port + bbb if port else 0)
+            self._handlers.append(handler)
+            self._servers.append(server)
+            urls.append('http://{}:{}'.format(host, server.sockets[0].getsockname()[1]))
+        return tuple(urls)
+
+    @asyncio.coroutine
+    def close(self):
+        for server in self._servers:
+            server.close()
+            yield from server.wait_closed()
+        for handler in self._handlers:
+            yield from handler.shutdown(1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080, help='www site port, bbb listens on the next one')
+    parser.add_argument('--pages', type=int, help='pages of every listing (default: as many as saved)')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response time in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of requests answered with a 503')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    loop = asyncio.get_event_loop()
+    standin = StandIn(loop, pages=args.pages, latency=args.latency, error_rate=args.error_rate)
+    urls = loop.run_until_complete(standin.start(port=args.port))
+    log.info('serving HIDDENSTREET_URL={} HIDDENSTREET_BBB_URL={}'.format(*urls))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(standin.close())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ import logging
 import random
 from discord.ext.commands import Bot, Context, command, group
 from commons.messages import get as msg
+from commons.outbox import Outbox
+from commons.throttle import single_flight
 from settings import LOGGER_IRONBOT
 
 
@@ -14,6 +16,7 @@ class Basic:
 
     def __init__(self, bot: Bot):
         self.b = bot
+        self.say = Outbox.of(bot).say
 
     @command()
     @asyncio.coroutine
@@ -22,27 +25,28 @@ class Basic:
         try:
             rolls, limit = map(int, dice.split('d'))
         except Exception:
-            yield from self.b.say(msg('roll.wrong format'))
+            self.say(msg('roll.wrong format'))
             return
     
         result = ', '.join(str(random.randint(1, limit)) for r in range(rolls))
-        yield from self.b.say(result)
+        self.say(result)
 
     @command(description='For when you wanna settle the score some other way')
     @asyncio.coroutine
     def choose(self, *choices: str):
         """Chooses between multiple choices."""
-        yield from self.b.say(random.choice(choices))
+        self.say(random.choice(choices))
 
     @command()
+    @single_flight
     @asyncio.coroutine
     def repeat(self, times: int, *content):
         """Repeats a message multiple times."""
         if times > 5:
-            yield from self.b.say(msg('repeat.no way'))
+            self.say(msg('repeat.no way'))
         else:
             for i in range(times):
-                yield from self.b.say(' '.join(content))
+                self.say(' '.join(content))
 
     @group(pass_context=True)
     @asyncio.coroutine
@@ -51,13 +55,13 @@ class Basic:
         In reality this just checks if a subcommand is being invoked.
         """
         if ctx.invoked_subcommand is None:
-            yield from self.b.say(msg('cool.no').format(ctx))
+            self.say(msg('cool.no').format(ctx))
 
     @cool.command(name='bot')
     @asyncio.coroutine
     def _bot(self):
         """Is the bot cool?"""
-        yield from self.b.say(msg('cool.yes'))
+        self.say(msg('cool.yes'))
 
 
 def setup(bot: Bot) -> None:
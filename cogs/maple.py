@@ -1,7 +1,7 @@
 # import aiohttp
 import asyncio
 import logging
-# import schedule
+import schedule
 import settings
 # from datetime import datetime, timedelta
 # from discord import ChannelType
@@ -9,6 +9,8 @@ from discord.ext.commands import Bot, command  # , check
 # from pytz import utc, timezone
 # from commons import checks
 from commons.messages import get as msg
+from commons.outbox import Outbox
+from commons.throttle import single_flight
 # from commons.errors import catch_exceptions
 from crawlers.hiddenstreet import HiddenStreet
 
@@ -35,13 +37,23 @@ def format_pierre_interval(hours: int, minutes: int, seconds: int) -> str:
     return fmt.format(**data)
 
 
+def closest_name(similar: list):
+    """The most similar of (name, similarity) pairs, when similar enough and ahead of the others"""
+    if similar and similar[0][1] >= settings.FUZZY_AUTOCORRECT and (len(similar) == 1 or similar[1][1] < similar[0][1]):
+        return similar[0][0]
+
+
 class Maple:
     """Maple Story commands"""
 
     def __init__(self, bot: Bot):
 
         self.b = bot
+        self.say = Outbox.of(bot).say
         self.hiddenstreet = HiddenStreet(bot.loop)
+        self.hiddenstreet.warm_up()
+        self.refresh_job = schedule.every(settings.DATA_REFRESH_INTERVAL).seconds.do(
+            self.hiddenstreet.refresh_in_background)
 
         # if settings.SET_SERVER_START_DEFAULT is None:
         #     self.server_start = None
@@ -110,7 +122,12 @@ class Maple:
     #     t = self.pierre_next_respawn().total_seconds()
     #     yield from self.b.say(format_pierre_interval(t // 3600, t % 3600 // 60, t % 60))
 
+    def __unload(self):
+        schedule.cancel_job(self.refresh_job)
+        self.hiddenstreet.close()
+
     @command(name='mobstats')
+    @single_flight
     @asyncio.coroutine
     def monster_stats(self, *words):
         """Finds stats for a monster put --exact (or -e for short) to \
@@ -122,26 +139,32 @@ concession from http://bbb.hidden-street.net/"""
         else:
             name = ' '.join(words)
 
-        result = self.hiddenstreet.monsters_by_name(name, exact_match=flag)
-        if len(result) == 0:
-            yield from self.b.say(msg('monster_stats.no results').format(name))
+        result = yield from self.hiddenstreet.monsters_by_name_async(name, exact_match=flag)
+        if len(result) == 0 and self.hiddenstreet.ready:
+            similar = yield from self.hiddenstreet.similar_monster_names_async(name)
+            correction = closest_name(similar)
+            if correction is not None:
+                self.say(msg('monster_stats.corrected').format(correction))
+                result = yield from self.hiddenstreet.monsters_by_name_async(correction, exact_match=True)
+            elif similar:
+                self.say(msg('monster_stats.did you mean').format(
+                    name, '", "'.join(n for n, _ in similar)))
+                return
+
+        if len(result) == 0 and not self.hiddenstreet.ready:
+            self.say(msg('monster_stats.warming up'))
+        elif len(result) == 0:
+            self.say(msg('monster_stats.no results').format(name))
         elif len(result) > 3:
             n = '", "'.join([m.name for m in result])
-            yield from self.b.say(msg('monster_stats.too many').format(n))
+            self.say(msg('monster_stats.too many').format(n))
         else:
 
-            for monster in result:
-                if monster.experience:
-                    monster.experience *= 4
-                mdict = monster.to_dict
-                mdict['link'] = 'http://bbb.hidden-street.net/monster/{}'.format(
-                    monster.name.lower().replace(' ', '-').replace('\'', ''))
-                message = msg('monster_stats.result').format(**mdict)
-                if monster.image_url:
-                    message += '\n{}'.format(monster.image_url)
-                yield from self.b.say(message)
+            for reply in (yield from self.hiddenstreet.replies_async(result)):
+                self.say(reply)
 
     @command(name='maple')
+    @single_flight
     @asyncio.coroutine
     def maple_weapons_info(self, *search_terms):
         """Finds stats and drop locations for a Maple Weapon. Please note that level 77 Maple Pyrope Weapons \
@@ -151,39 +174,99 @@ are events only, and thus not available for searching."""
         #    yield from self.b.say(msg('maple_weapons_info.pyrope'))
         #    return
 
-        result = self.hiddenstreet.maple_weapon_by_name(*search_terms)
+        result = yield from self.hiddenstreet.maple_weapon_by_name_async(*search_terms)
+        if len(result) == 0:
+            similar = yield from self.hiddenstreet.similar_maple_weapon_names_async(' '.join(search_terms))
+            correction = closest_name(similar)
+            if correction is not None:
+                result = yield from self.hiddenstreet.maple_weapon_by_name_async(correction)
+            elif similar:
+                self.say(msg('maple_weapons_info.did you mean').format(
+                    keyword=' '.join(search_terms), names=', '.join(n for n, _ in similar), **settings.BOT))
+                return
 
         if len(result) == 0:
-            yield from self.b.say(msg('maple_weapons_info.no results').format(keyword=' '.join(search_terms),
-                                                                              **settings.BOT))
+            self.say(msg('maple_weapons_info.no results').format(keyword=' '.join(search_terms), **settings.BOT))
         elif len(result) > 3:
-            yield from self.b.say(msg('maple_weapons_info.too many').format(**settings.BOT))
+            self.say(msg('maple_weapons_info.too many').format(**settings.BOT))
         else:
             log.debug('gotten {} records from backend'.format(len(result)))
-            library_link = 'https://mapleroyals.com/library/?page=items&id={}'
-            img_template = 'https://mapleroyals.com/library/images/item/{:08d}.png'
-            for maple_weapon in result:
-                log.debug(maple_weapon)
-                d = maple_weapon.to_dict
-                if maple_weapon.weapon_type in ['STAFF', 'WAND']:
-                    d['magic_attack_string'] = ' **Magic Attack** ' + maple_weapon.magic_attack
-                else:
-                    d['magic_attack_string'] = ''
-                d['library_link'] = library_link.format(maple_weapon.id_weapon)
-                d['image_link'] = img_template.format(maple_weapon.id_weapon)
-                yield from self.b.say(msg('maple_weapons_info.result').format(**d))
+            for reply in (yield from self.hiddenstreet.replies_async(result)):
+                self.say(reply)
+
+    @command(name='complete')
+    @single_flight
+    @asyncio.coroutine
+    def complete_names(self, *words):
+        """Lists the monsters and Maple Weapons whose name starts with the given words, lowest level first. \
+Example: !complete zak"""
+        prefix = ' '.join(words)
+        monsters = yield from self.hiddenstreet.complete_monster_names_async(prefix)
+        maple_weapons = yield from self.hiddenstreet.complete_maple_weapon_names_async(prefix)
+
+        lines = []
+        if monsters:
+            lines.append(msg('complete.monsters').format(', '.join(monsters)))
+        if maple_weapons:
+            lines.append(msg('complete.maple weapons').format(', '.join(maple_weapons)))
+        if not lines and not self.hiddenstreet.ready:
+            self.say(msg('monster_stats.warming up'))
+        elif not lines:
+            self.say(msg('complete.no results').format(prefix))
+        else:
+            self.say('\n'.join(lines))
+
+    @single_flight
+    @asyncio.coroutine
+    def _ranking(self, score: str, min_level: int=None, max_level: int=None):
+        if min_level is not None and max_level is None:
+            max_level = min_level
+        result = yield from self.hiddenstreet.rank_monsters_async(score, min_level, max_level)
+        if not result and not self.hiddenstreet.ready:
+            self.say(msg('monster_stats.warming up'))
+            return
+        if not result:
+            self.say(msg('ranking.no results'))
+            return
+
+        window = '' if min_level is None else msg('ranking.window').format(min_level=min_level, max_level=max_level)
+        lines = [msg('ranking.{}'.format(score)).format(window=window)]
+        lines += [msg('ranking.result').format(rank=rank, **monster._asdict())
+                  for rank, monster in enumerate(result, 1)]
+        self.say('\n'.join(lines))
+
+    @command(name='bestexp')
+    @asyncio.coroutine
+    def best_exp(self, min_level: int=None, max_level: int=None):
+        """Lists the monsters giving the most EXP per HP, optionally between two levels. Example: !bestexp 50 60"""
+        yield from self._ranking('exp', min_level, max_level)
+
+    @command(name='bestmesos')
+    @asyncio.coroutine
+    def best_mesos(self, min_level: int=None, max_level: int=None):
+        """Lists the monsters dropping the most mesos per HP, optionally between two levels. \
+Example: !bestmesos 50 60"""
+        yield from self._ranking('mesos', min_level, max_level)
+
+    @command(name='bestexpdef')
+    @asyncio.coroutine
+    def best_exp_defence(self, min_level: int=None, max_level: int=None):
+        """Lists the monsters giving the most EXP per HP plus weapon defence, optionally between two levels. \
+Example: !bestexpdef 50 60"""
+        yield from self._ranking('expdef', min_level, max_level)
 
     @command(name='maplelist')
+    @single_flight
     @asyncio.coroutine
-    def maple_list_info(self, weapon_level: int=None):
-        """Prints a simple list for all the Maple Weapons currently available in game."""
+    def maple_list_info(self, weapon_level: int=None, max_level: int=None):
+        """Prints a simple list for all the Maple Weapons currently available in game. Give a level to only \
+list the ones of that level, or two levels for the ones in between. Example: !maplelist 35 64"""
 
-        result = self.hiddenstreet.maple_list_by_level(weapon_level)
+        result = self.hiddenstreet.maple_list_by_level(weapon_level, max_level)
 
         log.debug('gotten {} records from backend'.format(len(result)))
         for w in result:
-            yield from self.b.say(msg('maple_list_info.result').format(required_level=w.required_level,
-                                                                       names=w.names))
+            self.say(msg('maple_list_info.result').format(required_level=w.required_level, names=w.names))
 
     # @command(name='set-server-start', hidden=True)
     # @check(checks.is_admin)
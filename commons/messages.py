@@ -25,11 +25,15 @@ def initialize():
             log.debug('File {} loaded'.format(full_path))
 
 
-def get(key: str, channel_id: int = None) -> str:
+def language(channel_id: int = None) -> str:
     if channel_id is None or channel_id not in _ch2lang:
-        lang = DEFAULT_LANG
-    else:
-        lang = _ch2lang[channel_id]
+        return DEFAULT_LANG
+    return _ch2lang[channel_id]
+
+
+def get(key: str, channel_id: int = None, lang: str = None) -> str:
+    if lang is None:
+        lang = language(channel_id)
 
     if key in msg_map[lang]:
         return msg_map[lang][key]
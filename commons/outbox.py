@@ -0,0 +1,138 @@
+"""Outbound messages, queued per channel.
+
+Command handlers put their replies in the outbox and go on without
+waiting for Discord. A worker per channel with replies pending sends
+them in order, joining consecutive replies into as few messages as
+MESSAGE_LIMIT allows, and paces the messages after Discord's rate limits:
+settings.OUTBOX_RATE messages every settings.OUTBOX_PER seconds in a
+channel, settings.OUTBOX_GLOBAL_RATE per second overall.
+"""
+import asyncio
+import logging
+import sys
+import time
+import settings
+from collections import Counter, deque
+from discord.ext.commands import Bot
+from .ratelimit import TokenBucket
+
+log = logging.getLogger(settings.LOGGER_IRONBOT)
+
+MESSAGE_LIMIT = 2000  # characters in a Discord message
+SEPARATOR = '\n'
+
+
+def pack(pending: deque, limit: int=MESSAGE_LIMIT) -> str:
+    """Takes the replies at the start of pending fitting in a message of limit characters.
+    A reply longer than limit is cut at its last line break within limit (or at limit when it
+    has none) and the rest is put back"""
+    content = pending.popleft()
+    if len(content) > limit:
+        cut = content.rfind('\n', 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        rest = content[cut:].lstrip('\n')
+        if rest:
+            pending.appendleft(rest)
+        return content[:cut]
+
+    parts = [content]
+    size = len(content)
+    while pending and size + len(SEPARATOR) + len(pending[0]) <= limit:
+        parts.append(pending.popleft())
+        size += len(SEPARATOR) + len(parts[-1])
+    return SEPARATOR.join(parts)
+
+
+def command_channel():
+    """Channel of the command being run, found on the stack like Bot.say does"""
+    frame = sys._getframe(1)
+    try:
+        while frame is not None:
+            if '_internal_channel' in frame.f_locals:
+                return frame.f_locals['_internal_channel']
+            frame = frame.f_back
+    finally:
+        del frame
+    raise RuntimeError('No command is being run')
+
+
+class Outbox:
+    """Replies waiting to be sent, by destination.
+
+    send is a coroutine function taking the destination and the content,
+    like Bot.send_message."""
+
+    def __init__(self, send, loop, limit: int=MESSAGE_LIMIT, rate: float=None, per: float=None,
+                 global_rate: float=None, clock=time.monotonic):
+        self.send = send
+        self.loop = loop
+        self.limit = limit
+        self.rate = rate or settings.OUTBOX_RATE
+        self.per = per or settings.OUTBOX_PER
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate or settings.OUTBOX_GLOBAL_RATE, 1, clock)
+        self.pending = {}
+        self.buckets = {}
+        self.workers = {}
+        self.counters = Counter()
+
+    @classmethod
+    def of(cls, bot: Bot) -> 'Outbox':
+        """The outbox of bot, made on first use"""
+        outbox = getattr(bot, 'outbox', None)
+        if outbox is None:
+            outbox = bot.outbox = cls(bot.send_message, bot.loop)
+        return outbox
+
+    def put(self, destination, content):
+        """Queues content for destination, starting its worker when not running"""
+        content = str(content)
+        if not content:
+            return
+        self.pending.setdefault(destination, deque()).append(content)
+        self.counters['replies'] += 1
+        if destination not in self.workers:
+            self.workers[destination] = self.loop.create_task(self._drain(destination))
+
+    def say(self, content):
+        """Queues content for the channel of the command being run, Bot.say without the wait"""
+        self.put(command_channel(), content)
+
+    @asyncio.coroutine
+    def _drain(self, destination):
+        pending = self.pending[destination]
+        bucket = self.buckets.get(destination)
+        if bucket is None:
+            bucket = self.buckets[destination] = TokenBucket(self.rate, self.per, self.clock)
+        try:
+            while pending:
+                delay = max(bucket.delay(), self.global_bucket.delay())
+                if delay > 0:
+                    self.counters['paced'] += 1
+                    yield from asyncio.sleep(delay, loop=self.loop)
+                    continue
+                bucket.take()
+                self.global_bucket.take()
+                content = pack(pending, self.limit)
+                self.counters['messages'] += 1
+                try:
+                    yield from self.send(destination, content)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.counters['failed'] += 1
+                    log.exception('Failed to send a message to {}'.format(destination))
+        finally:
+            del self.workers[destination]
+            if not pending:
+                del self.pending[destination]
+            # a channel quiet long enough to have its bucket full again starts over with a new one
+            for idle in [d for d, b in self.buckets.items() if d not in self.workers and b.full]:
+                del self.buckets[idle]
+
+    @asyncio.coroutine
+    def flush(self):
+        """Waits until every queued reply is sent"""
+        while self.workers:
+            yield from asyncio.wait(list(self.workers.values()), loop=self.loop)
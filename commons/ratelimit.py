@@ -0,0 +1,36 @@
+import time
+
+
+class TokenBucket:
+    """rate tokens every per seconds, at most rate of them saved up.
+
+    Time comes from clock, time.monotonic by default."""
+
+    def __init__(self, rate: float, per: float, clock=time.monotonic):
+        self.rate = rate
+        self.per = per
+        self.clock = clock
+        self.tokens = float(rate)
+        self.updated = clock()
+
+    def _refill(self) -> float:
+        now = self.clock()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        return self.tokens
+
+    def delay(self) -> float:
+        """Time in seconds before a token is available, 0 when there is one"""
+        tokens = self._refill()
+        return 0.0 if tokens >= 1 else (1 - tokens) * self.per / self.rate
+
+    def take(self) -> bool:
+        """Takes a token when there is one"""
+        if self._refill() < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    @property
+    def full(self) -> bool:
+        return self._refill() >= self.rate
@@ -0,0 +1,57 @@
+"""Replies of the data commands, rendered from a row and a language"""
+import settings
+from entities.models import Monster, MapleWeapon
+from .messages import get as msg
+
+MONSTER_LINK = 'http://bbb.hidden-street.net/monster/{}'
+LIBRARY_LINK = 'https://mapleroyals.com/library/?page=items&id={}'
+LIBRARY_IMAGE = 'https://mapleroyals.com/library/images/item/{:08d}.png'
+
+
+def monster(row: Monster, lang: str) -> str:
+    d = row.to_dict
+    if row.experience:
+        d['experience'] = row.experience * settings.EXP_RATE
+    d['link'] = MONSTER_LINK.format(row.name.lower().replace(' ', '-').replace('\'', ''))
+    reply = msg('monster_stats.result', lang=lang).format(**d)
+    if row.image_url:
+        reply += '\n{}'.format(row.image_url)
+    return reply
+
+
+def maple_weapon(row: MapleWeapon, lang: str) -> str:
+    d = row.to_dict
+    if row.weapon_type in ['STAFF', 'WAND']:
+        d['magic_attack_string'] = ' **Magic Attack** {}'.format(row.magic_attack)
+    else:
+        d['magic_attack_string'] = ''
+    d['library_link'] = LIBRARY_LINK.format(row.id_weapon)
+    d['image_link'] = LIBRARY_IMAGE.format(row.id_weapon)
+    return msg('maple_weapons_info.result', lang=lang).format(**d)
+
+
+renderers = {Monster: monster, MapleWeapon: maple_weapon}
+
+
+class Replies:
+    """Rendered replies of the records (see entities/records.py) of one generation of data, by record
+    and language. Keying by the whole record rather than its primary key, a record of the previous
+    generation can never get the reply of another row"""
+
+    def __init__(self):
+        self.rendered = {}
+
+    def get(self, row, lang: str) -> str:
+        key = (row.model, row, lang)
+        reply = self.rendered.get(key)
+        if reply is None:
+            reply = self.rendered[key] = renderers[row.model](row, lang)
+        return reply
+
+    def render_all(self, rows, languages: list):
+        for row in rows:
+            for lang in languages:
+                self.get(row, lang)
+
+    def __len__(self):
+        return len(self.rendered)
@@ -0,0 +1,109 @@
+"""Limits on bursts of commands.
+
+Throttle is a global check of the bot: every user gets
+settings.THROTTLE_USER_RATE commands every settings.THROTTLE_USER_PER
+seconds, every server settings.THROTTLE_SERVER_RATE every
+settings.THROTTLE_SERVER_PER seconds. Commands over the limits are
+rejected before their arguments are parsed.
+
+single_flight makes the invocations of a command with the same arguments
+in the same channel, while one of them is running, share its execution:
+the one running replies, the others only wait for it to end.
+"""
+import asyncio
+import functools
+import time
+import weakref
+import settings
+from collections import Counter
+from discord.ext.commands import CheckFailure, Context
+from crawlers.querycache import normalize
+from .outbox import command_channel
+from .ratelimit import TokenBucket
+
+
+class Throttled(CheckFailure):
+    """A command over the limits, notify telling whether it is the first one of the user since the
+    last command that went through"""
+
+    def __init__(self, retry_after: float, notify: bool):
+        super().__init__('Throttled, retry after {:.1f}s'.format(retry_after))
+        self.retry_after = retry_after
+        self.notify = notify
+
+
+class Throttle:
+    """Per user and per server token buckets, as a global check of the bot"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.users = {}
+        self.servers = {}
+        self.warned = {}
+        self.charged = weakref.WeakSet()
+        self.counters = Counter()
+
+    def _bucket(self, buckets: dict, key, rate: float, per: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            # buckets full again are the same as new ones, dropped when there are many
+            if len(buckets) >= settings.THROTTLE_MAX_BUCKETS:
+                for idle in [k for k, b in buckets.items() if b.full]:
+                    del buckets[idle]
+            bucket = buckets[key] = TokenBucket(rate, per, self.clock)
+        return bucket
+
+    def __call__(self, ctx: Context) -> bool:
+        if ctx in self.charged:
+            # checks run again with the context of a command that went through, for the subcommand of a
+            # group or for every command !help lists, and must not cost more tokens
+            return True
+        author, server = ctx.message.author, ctx.message.server
+        buckets = [self._bucket(self.users, author.id, settings.THROTTLE_USER_RATE, settings.THROTTLE_USER_PER)]
+        if server is not None:
+            buckets.append(self._bucket(self.servers, server.id, settings.THROTTLE_SERVER_RATE,
+                                        settings.THROTTLE_SERVER_PER))
+
+        retry_after = max(bucket.delay() for bucket in buckets)
+        if retry_after > 0:
+            self.counters['rejected'] += 1
+            notify = author.id not in self.warned
+            if notify and len(self.warned) >= settings.THROTTLE_MAX_BUCKETS:
+                # users rejected a refill ago have their bucket full again, as if they were never warned
+                now = self.clock()
+                for idle in [k for k, rejected in self.warned.items() if now - rejected >= settings.THROTTLE_USER_PER]:
+                    del self.warned[idle]
+            self.warned[author.id] = self.clock()
+            raise Throttled(retry_after, notify)
+        for bucket in buckets:
+            bucket.take()
+        self.charged.add(ctx)
+        self.warned.pop(author.id, None)
+        self.counters['passed'] += 1
+        return True
+
+
+def single_flight(func):
+    """Decorates the coroutine function of a command of a cog keeping the bot in self.b"""
+    in_flight = {}
+
+    @functools.wraps(func)
+    @asyncio.coroutine
+    def wrapper(self, *args, **kwargs):
+        key = (command_channel(), normalize(' '.join(map(str, args))), tuple(sorted(kwargs.items())))
+        flight = in_flight.get(key)
+        if flight is not None:
+            yield from asyncio.shield(flight, loop=self.b.loop)
+            return
+
+        # the first invocation runs the command itself rather than in a task, for its replies to find
+        # the channel on the stack
+        flight = in_flight[key] = asyncio.Future(loop=self.b.loop)
+        try:
+            return (yield from func(self, *args, **kwargs))
+        finally:
+            del in_flight[key]
+            flight.set_result(None)
+
+    wrapper.in_flight = in_flight
+    return wrapper
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import settings
+from collections import Counter
+from email.utils import formatdate
+from aiohttp import hdrs
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+
+class CacheEntry:
+    """Validators and content hash of a cached page, plus the rows parsed out of it"""
+
+    __slots__ = ('url', 'etag', 'last_modified', 'sha256', 'stored', 'parser', 'rows')
+
+    def __init__(self, url, etag=None, last_modified=None, sha256=None, stored=0.0, parser=None, rows=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+        self.stored = stored
+        self.parser = parser
+        self.rows = rows
+
+    def rows_for(self, parser: str):
+        return self.rows if parser is not None and parser == self.parser else None
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers[hdrs.IF_NONE_MATCH] = self.etag
+        if self.last_modified:
+            headers[hdrs.IF_MODIFIED_SINCE] = self.last_modified
+        elif not self.etag:
+            headers[hdrs.IF_MODIFIED_SINCE] = formatdate(self.stored, usegmt=True)
+        return headers
+
+
+def content_hash(page: str) -> str:
+    return hashlib.sha256(page.encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    """On disk HTTP cache for crawled pages, keyed by URL.
+
+    Every entry is a body file plus a json file with its validators (ETag,
+    Last-Modified), the body hash and the rows parsed out of it, so that
+    a page known to be unchanged needs neither a download nor a parse.
+    Entries are evicted least recently used first when the cache grows
+    over max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int, max_age: int=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.counters = Counter()
+        self._index = {}  # key -> (size, last access)
+        os.makedirs(directory, exist_ok=True)
+
+        for name in os.listdir(directory):
+            key, ext = os.path.splitext(name)
+            if ext == '.json':
+                self._touch_index(key)
+
+    @property
+    def size(self) -> int:
+        return sum(size for size, _ in self._index.values())
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.html'
+
+    def _touch_index(self, key):
+        try:
+            stats = [os.stat(path) for path in self._paths(key)]
+        except FileNotFoundError:
+            self._index.pop(key, None)
+        else:
+            self._index[key] = (sum(s.st_size for s in stats), stats[0].st_mtime)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url: str):
+        key = self.key(url)
+        if key not in self._index:
+            return None
+        meta_path, _ = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                entry = CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            log.warn('discarding unreadable cache entry for {}'.format(url))
+            self.discard(url)
+            return None
+        os.utime(meta_path)
+        self._touch_index(key)
+        if key not in self._index:
+            log.warn('discarding cache entry for {}, its body is missing'.format(url))
+            self.discard(url)
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored < self.max_age
+
+    def body(self, entry: CacheEntry) -> str:
+        """Cached page of entry, None (and the entry discarded) when it cannot be read"""
+        try:
+            with open(self._paths(self.key(entry.url))[1], encoding='utf-8') as f:
+                return f.read()
+        except (OSError, ValueError):
+            log.warn('discarding cache entry for {}, its body is unreadable'.format(entry.url))
+            self.discard(entry.url)
+            return None
+
+    def store(self, entry: CacheEntry, page: str=None):
+        meta_path, body_path = self._paths(self.key(entry.url))
+        if page is not None:
+            with open(body_path, 'w', encoding='utf-8') as f:
+                f.write(page)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(entry.to_dict(), f)
+        self._touch_index(self.key(entry.url))
+        self.evict()
+
+    def store_rows(self, url: str, rows: list, parser: str):
+        entry = self.lookup(url)
+        if entry is not None:
+            entry.rows = rows
+            entry.parser = parser
+            self.store(entry)
+
+    def discard(self, url: str):
+        self._remove(self.key(url))
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._index.pop(key, None)
+
+    def evict(self):
+        size = self.size
+        if size <= self.max_bytes:
+            return
+        for key, (entry_size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            self._remove(key)
+            self.counters['evicted'] += 1
+            size -= entry_size
+            if size <= self.max_bytes:
+                break
+
+    def log_stats(self):
+        log.info('http cache: {hit} hits, {revalidated} revalidated, {miss} misses, {evicted} evicted '
+                 '({entries} entries, {kib:.1f} KiB)'.format(entries=len(self._index), kib=self.size / 1024,
+                                                             **{k: self.counters[k] for k in ('hit', 'revalidated',
+                                                                                              'miss', 'evicted')}))
+        self.counters.clear()
@@ -0,0 +1,255 @@
+"""Parser backend compiled from a declarative column spec.
+
+Every table layout (BBB monsters, monsters of the other servers, weapons)
+is described once: which cell (and which div inside it) holds each field,
+the field types coming from the peewee models. The spec is compiled into an
+extraction plan, and the plan decides once per page, looking at the first
+row, which of the shapes handled by convert() each column has and where
+exactly its value sits. Every other row of the page is then read by
+indexing straight to the value, with no search through the cell. A cell
+that does not look like the first row's one goes through convert() as
+usual, so layout drift within a page still gives the right value.
+
+Selected with PARSER_BACKEND = 'compiled', it returns the same rows as the
+other backends.
+"""
+import peewee
+from lxml import etree
+from typing import Optional
+from entities.models import Monster, Weapon
+from entities.enums import Server
+from . import lxmlparser
+from .lxmlparser import cast, string
+
+# the shapes convert() tells apart, in the order it probes them
+FIELD_ITEM, INLINE_LABEL, LAST_TEXT = range(3)
+
+# crawler bookkeeping, not coming from the page
+_NOT_PARSED = ('server', 'content_hash', 'deleted')
+
+
+def _path(el, target) -> tuple:
+    """Child indices leading from el down to target"""
+    path = []
+    while target is not el:
+        parent = target.getparent()
+        path.append(parent.index(target))
+        target = parent
+    return tuple(reversed(path))
+
+
+def _follow(el, path: tuple):
+    try:
+        for i in path:
+            el = el[i]
+    except IndexError:
+        return None
+    return el
+
+
+def _has_class(el, cls: str) -> bool:
+    return el is not None and el.tag == 'div' and cls in (el.get('class') or '').split()
+
+
+def probe(el) -> tuple:
+    """Shape of the value in el and the path to the element holding it, as convert() would find it"""
+    found = lxmlparser._first(lxmlparser.field_item_of, el)
+    if found is not None:
+        return FIELD_ITEM, _path(el, found)
+    div = lxmlparser._first(lxmlparser.first_div_of, el)
+    if div is not None and 'field-label-inline' in (div.get('class') or '').split():
+        return INLINE_LABEL, _path(el, div)
+    return LAST_TEXT, ()
+
+
+def reader(shape: int, path: tuple, field_type, strip_comma: bool):
+    """Function converting the value of a cell with the given shape, falling back to convert() otherwise"""
+    convert = lxmlparser.convert
+    if shape == FIELD_ITEM:
+        def read(el):
+            target = _follow(el, path)
+            if not _has_class(target, 'field-item'):
+                return convert(el, field_type, strip_comma)
+            return cast(string(target), field_type, strip_comma)
+    elif shape == INLINE_LABEL:
+        def read(el):
+            target = _follow(el, path)
+            if not _has_class(target, 'field-label-inline'):
+                return convert(el, field_type, strip_comma)
+            return cast(lxmlparser._last_text(target), field_type, strip_comma)
+    else:
+        def read(el):
+            for child in el:
+                if child.tag == 'div':
+                    return convert(el, field_type, strip_comma)
+            return cast(lxmlparser._last_text(el), field_type, strip_comma)
+    return read
+
+
+class Column:
+    """Where a field is in a table row: a cell, optionally the n-th div in it"""
+
+    __slots__ = ('name', 'cell', 'div', 'field_type', 'strip_comma')
+
+    def __init__(self, name: str, cell: int, div: Optional[int], field_type, strip_comma: bool):
+        self.name = name
+        self.cell = cell
+        self.div = div
+        self.field_type = field_type
+        self.strip_comma = strip_comma
+
+
+class Layout:
+    """Column spec of a table layout.
+
+    columns maps field names to a cell index or a (cell index, div index)
+    pair, divs being the child ones of the cell (or all the descendant ones
+    with nested_divs). Field types come from model, except for the text
+    ones. special(tag, cells, category) returns the fields needing more than
+    a conversion, and the model fields that are neither a column nor special
+    are None, unless listed in skip."""
+
+    def __init__(self, model, columns: dict, special, nested_divs=False, strip_comma=(), text=(), skip=()):
+        self.model = model
+        self.columns = columns
+        self.special = special
+        self.nested_divs = nested_divs
+        self.strip_comma = frozenset(strip_comma)
+        self.text = frozenset(text)
+        self.skip = frozenset(skip)
+
+    def compile(self) -> 'Plan':
+        columns = []
+        for name, where in self.columns.items():
+            cell, div = where if isinstance(where, tuple) else (where, None)
+            field = self.model._meta.fields[name]
+            field_type = int if isinstance(field, peewee.IntegerField) and name not in self.text else str
+            columns.append(Column(name, cell, div, field_type, name in self.strip_comma))
+        fields = [field.name for field in self.model._meta.sorted_fields
+                  if not isinstance(field, peewee.PrimaryKeyField) and field.name not in _NOT_PARSED]
+        empty = [name for name in fields if name not in self.columns and name not in self.skip]
+        return Plan(columns, self.special, empty, self.nested_divs)
+
+
+class Plan:
+    """Compiled layout, reading the rows of a page"""
+
+    def __init__(self, columns: list, special, empty: list, nested_divs: bool):
+        self.columns = columns
+        self.special = special
+        self.empty = empty
+        self.divs_of = lxmlparser.divs_of if nested_divs else lxmlparser.child_divs_of
+        self.grouped = sorted(set(column.cell for column in columns if column.div is not None))
+
+    def _locate(self, cells: list):
+        divs = {cell: self.divs_of(cells[cell]) for cell in self.grouped}
+        for column in self.columns:
+            yield column, cells[column.cell] if column.div is None else divs[column.cell][column.div]
+
+    def extract(self, tables: list, category=None) -> list:
+        if not tables:
+            return []
+        readers = [(column.name, reader(*probe(el), column.field_type, column.strip_comma))
+                   for column, el in self._locate(lxmlparser.cells_of(tables[0]))]
+
+        rows = []
+        for tag in tables:
+            cells = lxmlparser.cells_of(tag)
+            row = dict.fromkeys(self.empty)
+            row.update((name, read(el)) for (name, read), (_, el) in zip(readers, self._locate(cells)))
+            row.update(self.special(tag, cells, category))
+            rows.append(row)
+        return rows
+
+
+_monster_columns = dict(health_points=1, mana_points=2, experience=3, mesos=4, knockback=5, etc_drop=6,
+                        common_equipment=(7, 0), warrior_equipment=(7, 1), magician_equipment=(7, 2),
+                        bowman_equipment=(7, 3), thief_equipment=(7, 4), pirate_equipment=(7, 5),
+                        ore_drop=8, maker_item=9, useable_drop=10,
+                        weapon_attack=(11, 0), magic_attack=(11, 1), weapon_defence=(11, 2), magic_defence=(11, 3),
+                        phisical_dmg_reduction=(11, 4), magical_dmg_reduction=(11, 5), speed=(11, 6),
+                        accuracy=(11, 7), avoidability=(11, 8),
+                        unique_attack=(13, 0), health_points_recovery=(13, 1), mana_points_recovery=(13, 2),
+                        immune_against_status=(14, 0), inflict_status=(14, 1))
+
+
+def _image_url(cell) -> Optional[str]:
+    found = lxmlparser.img_src_of(cell)
+    return found[0] if found else None
+
+
+def _int_or_none(value) -> Optional[int]:
+    """First word of value as an int"""
+    try:
+        return int(value.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _monster_bbb(tag, cells, category) -> dict:
+    return dict(hiddenstreet_alias=tag.get('id'),
+                name=string(lxmlparser.first_strong_of(cells[0])[0]).strip(),
+                level=_int_or_none(lxmlparser._last_text(cells[0])),
+                image_url=_image_url(cells[0]))
+
+
+def _monster(tag, cells, category) -> dict:
+    link = lxmlparser.first_a_of(lxmlparser._first(lxmlparser.label_inline_of, cells[0]))[0]
+    level = lxmlparser._first(lxmlparser.child_strong_of, cells[0])
+    return dict(hiddenstreet_alias=link.get('href').split('/')[-1],
+                name=string(lxmlparser.first_strong_of(link)[0]),
+                level=_int_or_none(string(level) if level is not None else None),
+                image_url=_image_url(cells[0]))
+
+
+def _weapon(tag, cells, category) -> dict:
+    link = lxmlparser.first_a_of(lxmlparser.first_strong_of(cells[1])[0])[0]
+    sold_for = lxmlparser.convert(cells[9])
+    try:
+        sold_for = int(sold_for[:sold_for.index(' ')].replace(',', ''))
+    except (AttributeError, ValueError):
+        sold_for = 0
+    return dict(hiddenstreet_alias=link.get('href').split('/')[-1],
+                name=string(link),
+                weapon_type=category.value,
+                sold_for=sold_for)
+
+
+layouts = {
+    (Server.BEFORE_BIG_BANG, Monster): Layout(Monster,
+                                              dict(_monster_columns, weakness_to_magic=(12, 0),
+                                                   normal_to_magic=(12, 1), resistance_to_magic=(12, 2),
+                                                   immune_to_magic=(12, 3)),
+                                              _monster_bbb,
+                                              nested_divs=True,
+                                              strip_comma=('health_points', 'mana_points', 'experience', 'mesos')),
+    (None, Monster): Layout(Monster,
+                            dict(_monster_columns, weakness_to_magic=(12, 0), resistance_to_magic=(12, 1),
+                                 immune_to_magic=(12, 2)),
+                            _monster),
+    (None, Weapon): Layout(Weapon,
+                           dict(required_level=2, required_stats=3, weapon_attack=4, attack_speed=5, job=6,
+                                effects=7, available_upgrades=8, dropped_by=10),
+                           _weapon,
+                           skip=('description',))
+}
+
+plans = {key: layout.compile() for key, layout in layouts.items()}
+
+
+def plan_for(server: Server, model) -> Optional[Plan]:
+    return plans.get((server, model)) or (plans.get((None, model)) if server != Server.BEFORE_BIG_BANG else None)
+
+
+def parse_page(page: str, server: Server, model, category=None):
+    plan = plan_for(server, model)
+    if plan is None:
+        # BBB weapons, still not parsed
+        return []
+    root = etree.fromstring(page.encode('utf-8'), lxmlparser._parser)
+    if root is None:
+        return []
+    return plan.extract(lxmlparser.tables[server if server == Server.BEFORE_BIG_BANG else None](root), category)
+
+
+parse_last_page = lxmlparser.parse_last_page
@@ -1,21 +1,36 @@
 import asyncio
-import csv
+import datetime
 import functools
 import logging
-import operator
-import os
-import itertools
-import peewee
+import time
 import settings
-from aiohttp import ClientSession
+from collections import defaultdict, namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 from typing import Optional, Generic
-from entities.models import sqlite_db, Weapon, Monster, MapleWeapon
-from entities.enums import MonsterLevelType, Section, Server, UrlElement
+from commons import messages
+from commons.replies import Replies
+from entities.models import bind, search, DataGeneration, Weapon, Monster, MapleWeapon, SCHEMA_VERSION
+from entities.records import records
+from entities.store import DataStore, Slot
+from entities.enums import EquipmentType, MonsterLevelType, Section, Server, UrlElement, WeaponType
+from . import extractor, lxmlparser
+from .cache import HttpCache
+from .ingest import Ingestor
+from .mapleweapons import Catalogue
+from .names import PrefixIndex, TrigramIndex
+from .querycache import QueryCache, cached
+from .ranking import MonsterTable
+from .pipeline import CrawlPipeline, Throughput
+from .ratelimit import CrawlError
+from .session import CrawlerSession
 
 log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
 
+# bump whenever the parsers change the rows they return, so that rows kept in the HTTP cache get parsed again
+ROWS_VERSION = 3
+
 
 def convert(tag: Tag, field_type: Generic(str, int)=str, strip_comma=False):
     result = tag.find('div', class_='field-item')
@@ -51,7 +66,7 @@ def parse_monster_tag(tag: Tag, *args):
 
     monster = dict(hiddenstreet_alias=cells[0].find('div', 'field-label-inline').a.get('href').split('/')[-1],
                    name=cells[0].find('div', 'field-label-inline').a.strong.string,
-                   level=cells[0].find('strong', recursive=False),
+                   level=cells[0].find('strong', recursive=False).string,
                    health_points=convert(cells[1], int),
                    mana_points=convert(cells[2], int),
                    experience=convert(cells[3], int),
@@ -90,9 +105,8 @@ def parse_monster_tag(tag: Tag, *args):
     if monster['image_url']:
         monster['image_url'] = monster['image_url'].get('src')
     try:
-        tmp = monster['level'].index(' ')
-        monster['level'] = int(monster['level'][:tmp])
-    except ValueError:
+        monster['level'] = int(monster['level'].split()[0])
+    except (AttributeError, IndexError, ValueError):
         monster['level'] = None
     return monster
 
@@ -154,7 +168,8 @@ def parse_monster_bbb_tag(tag: Tag, *args):
 
 def parse_weapon_tag(tag: Tag, weapon_type):
     cells = tag.find_all('td')
-    weapon = dict(name=cells[1].strong.a.string,
+    weapon = dict(hiddenstreet_alias=cells[1].strong.a.get('href').split('/')[-1],
+                  name=cells[1].strong.a.string,
                   weapon_type=weapon_type.value,
                   required_level=convert(cells[2], int),
                   required_stats=convert(cells[3]),
@@ -171,7 +186,7 @@ def parse_weapon_tag(tag: Tag, weapon_type):
     try:
         tmp = weapon['sold_for'].index(' ')
         weapon['sold_for'] = int(weapon['sold_for'][:tmp].replace(',', ''))
-    except ValueError:
+    except (AttributeError, ValueError):
         weapon['sold_for'] = 0
     return weapon
 
@@ -220,177 +235,414 @@ def build_url(server: Server = Server.GLOBAL,
 
 
 @asyncio.coroutine
-def last_page(server, subsection, semaphore, category=None, *args, **argv):
-    url = build_url(server=server, subsection=subsection, category=category, *args, **argv)
-    m = 'last_page'
-    with (yield from semaphore):
-        with ClientSession() as client:
-            log.debug('({}) client {}: connecting to url {}'.format(m, id(client), url))
-            response = yield from client.get(url, compress=True)
-            log.debug('({}) client {}: got {} for url {}'.format(m, id(client), response.status, url))
-            resp_status = response.status
-            if response.status == 200:
-                page = yield from response.text()
-            log.debug('({}) client {}: connection to url {} closed'.format(m, id(client), (url)))
+def run_parser(executor: Optional[Executor], func, *args):
+    """Runs a CPU bound parsing function in executor, or inline when no executor is given"""
+    if executor is None:
+        return func(*args)
+    return (yield from asyncio.get_event_loop().run_in_executor(executor, func, *args))
 
-    if resp_status != 200:
-        if category is None:
-            return 0, subsection
-        else:
-            0, category
 
+def parse_last_page(page: str, server: Server) -> int:
     soup = BeautifulSoup(page, settings.BF4_PARSER)
-    if server == Server.BEFORE_BIG_BANG:
-        last_page_href = soup.find('li', class_='pager-last').a.get('href')
-        page_nr = int(last_page_href[last_page_href.index('page=') + 5:])
-    else:
-        # TODO to be implemented
-        page_nr = 0
+    pager_last = soup.find('li', class_='pager-last')
+    if pager_last is None:
+        # a single page, no pager
+        return 0
+    last_page_href = pager_last.a.get('href')
+    return int(last_page_href[last_page_href.index('page=') + 5:])
 
+
+@asyncio.coroutine
+def last_page(session, server, subsection, category=None, *args,
+              executor=None, parse=parse_last_page, **argv):
+    url = build_url(server=server, subsection=subsection, category=category, *args, **argv)
+    resp_status, page, _ = yield from session.get(url, 'last_page')
+
+    if resp_status != 200:
+        raise CrawlError(url, 'HTTP {:d}'.format(resp_status))
+
+    page_nr = yield from run_parser(executor, parse, page, server)
     return (page_nr, subsection) if category is None else (page_nr, category)
 
 
 @asyncio.coroutine
-def scrape(server, subsection, semaphore, model,
-           category=None, *args, **argv):
+def fetch_page(session, server, subsection, category=None, *args, parser=None, **argv):
     url = build_url(server=server, subsection=subsection, category=category, *args, **argv)
-    result = []
-    m = 'scrape'
-    with (yield from semaphore):
-        with ClientSession() as client:
-            log.debug('({}) client {}: connecting to url {}'.format(m, id(client), url))
-            response = yield from client.get(url, compress=True)
-            log.debug('({}) client {}: got {:d} for url {}'.format(m, id(client), response.status, url))
-            resp_status = response.status
-            if response.status == 200:
-                page = yield from response.text()
-            log.debug('({}) client {}: connection to url {} closed'.format(m, id(client), url))
+    resp_status, page, rows = yield from session.get(url, 'fetch_page', parser=parser)
 
     if resp_status != 200:
-        if category is None:
-            return result, subsection
-        else:
-            return result, category
+        raise CrawlError(url, 'HTTP {:d}'.format(resp_status))
+    return page, rows
 
+
+def parse_page(page: str, server: Server, model, category=None):
+    """Parses a whole page into plain row dicts, strings are detached from the
+    parse tree so that rows are cheap to pickle back from a worker process"""
     soup = BeautifulSoup(page, settings.BF4_PARSER)
     tag_cls_name = 'monster' if server == Server.BEFORE_BIG_BANG else 'database-info'
+    return [{k: str(v) if isinstance(v, str) else v for k, v in parse_funcs[(server, model)](tag, category).items()}
+            for tag in soup.find_all('table', class_=tag_cls_name)]
 
-    for tag in soup.find_all('table', class_=tag_cls_name):
-        result.append(parse_funcs[(server, model)](tag, category))
 
-    if category:
-        log.info('parsing of {} -> {} done'.format(subsection, category))
-        return result, category
-    else:
-        log.info('parsing of {} done'.format(subsection))
-        return result, subsection
+parser_backends = {
+    'bs4': (parse_page, parse_last_page),
+    'lxml': (lxmlparser.parse_page, lxmlparser.parse_last_page),
+    'compiled': (extractor.parse_page, extractor.parse_last_page)
+}
+
+
+class CrawlPage(namedtuple('CrawlPage', ('server', 'section', 'subsection', 'category', 'model', 'page'))):
+    __slots__ = ()
+
+    @property
+    def url(self):
+        return build_url(server=self.server, section=self.section, subsection=self.subsection,
+                         category=self.category, page=self.page)
+
+
+def plan_crawl(servers=None) -> list:
+    """First page of every listing the crawler knows how to parse, for every server (or the given ones):
+    monsters by level range and weapons by type. BBB weapons have no parser yet"""
+    targets = []
+    for server in servers or Server:
+        for lvl in MonsterLevelType.for_server(server):
+            targets.append(CrawlPage(server=server,
+                                     section=Section.MONSTER,
+                                     subsection=lvl,
+                                     category=None,
+                                     model=Monster,
+                                     page=0))
+        if server != Server.BEFORE_BIG_BANG:
+            for weapon_type in WeaponType:
+                targets.append(CrawlPage(server=server,
+                                         section=Section.EQUIPMENT,
+                                         subsection=EquipmentType.WEAPON,
+                                         category=weapon_type,
+                                         model=Weapon,
+                                         page=0))
+    return targets
+
+
+def awaitable(method):
+    """Awaitable version of a HiddenStreet method, running on its database thread"""
+    @asyncio.coroutine
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return (yield from self.on_db_thread(method, self, *args, **kwargs))
+    return wrapper
 
 
 class HiddenStreet:
-    base_url = 'https://www.hidden-street.net'
-    base_url_bbb = 'http://bbb.hidden-street.net'
+    base_url = settings.HIDDENSTREET_URL
+    base_url_bbb = settings.HIDDENSTREET_BBB_URL
 
     def __init__(self, loop):
-        self.db = sqlite_db
-        self.db.create_tables([Weapon, Monster, MapleWeapon])
         self.max_bulk_rows = 20
-        self.db_refreshing = False
-        self.refresh_data(loop)
-
-        maple_weapons = []
-        with open(os.path.join(os.path.dirname(__file__), 'mapleweapons.csv')) as csvfile:
-            list_reader = csv.DictReader(csvfile)
-            for weapon in list_reader:
-                maple_weapons.append(weapon)
-
-        with self.db.atomic():
-            for i in range(0, len(maple_weapons), self.max_bulk_rows):
-                top = i + self.max_bulk_rows
-                MapleWeapon.insert_many(maple_weapons[i:top]).execute()
-                if len(maple_weapons) == 0:
-                    log.warn('empty result set for maple weapons')
+        self.loop = loop
+        self.cache = HttpCache(settings.HTTP_CACHE_DIR, settings.HTTP_CACHE_MAX_BYTES, settings.HTTP_CACHE_MAX_AGE)
+        self.session = CrawlerSession(loop, self.cache)
+        self.executor = ProcessPoolExecutor(settings.PARSER_PROCESSES) if settings.PARSER_PROCESSES > 0 else None
+        self.db_thread = ThreadPoolExecutor(1)
+        self._refresh_task = None
+        self.pipeline = None
+        self.throughput = None
+        self.parser = settings.PARSER_BACKEND
+        self.parse_page, self.parse_last_page = parser_backends[self.parser]
+        self.parser_tag = '{}/{}'.format(self.parser, ROWS_VERSION)
+        self.created = time.monotonic()
+        self.warmed_up = asyncio.Event(loop=loop)
+        self.query_cache = QueryCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL)
+        self.maple_catalogue = Catalogue.load()
+        self.store = DataStore(settings.DATABASE_PATH, [Weapon, Monster, MapleWeapon], on_open=self.load_maple_weapons)
+        self.open_snapshot()
+
+    def load_maple_weapons(self, slot: Slot):
+        with bind(slot.db, [MapleWeapon]), slot.db.atomic():
+            MapleWeapon.delete().execute()
+            self.maple_catalogue.insert(slot.db)
+        if not self.maple_catalogue.rows:
+            log.warn('empty result set for maple weapons')
+
+    @property
+    def generation(self) -> Optional[DataGeneration]:
+        """Generation of the data queries are answered from"""
+        return self.store.live.generation
+
+    def open_snapshot(self):
+        generation = self.generation
+        if generation is not None:
+            log.info('opened snapshot generation {} completed on {} UTC in {:.1f}ms'.format(
+                generation.generation, generation.completed, (time.monotonic() - self.created) * 1000))
+        if not self.is_stale(generation):
+            self.warmed_up.set()
+        self.prerender()
+
+    @staticmethod
+    def is_stale(generation: Optional[DataGeneration]) -> bool:
+        if generation is None or generation.errors:
+            return True
+        return datetime.datetime.utcnow() - generation.completed > datetime.timedelta(seconds=settings.SNAPSHOT_MAX_AGE)
+
+    def warm_up(self) -> Optional[asyncio.Task]:
+        """Refreshes data in background, unless the snapshot opened at startup is recent enough"""
+        if self.is_stale(self.generation):
+            return self.refresh_in_background()
+        log.info('snapshot generation {} is fresh, skipping refresh'.format(self.generation.generation))
+
+    @property
+    def ready(self) -> bool:
+        """False until the first refresh went through, queries only see what was ingested so far meanwhile"""
+        return self.warmed_up.is_set()
+
+    def refresh_in_background(self) -> asyncio.Task:
+        """Schedules a crawl on the loop, parsing happens in the process pool
+        so the loop stays free for the Discord gateway and commands meanwhile"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = self.loop.create_task(self.refresh())
+            self._refresh_task.add_done_callback(self._refresh_done)
+        return self._refresh_task
+
+    def _refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error('background refresh failed', exc_info=task.exception())
 
     def refresh_data(self, loop):
-        self.db_refreshing = True
-        log.info('refreshing data...')
-        semaphore = asyncio.Semaphore(5)
-        f = asyncio.wait([last_page(semaphore=semaphore,
-                                    server=Server.BEFORE_BIG_BANG,
-                                    section=Section.MONSTER,
-                                    subsection=lvl)
-                          for lvl in MonsterLevelType])
-        finished, pending = loop.run_until_complete(f)
-
-        cats_pages = [itertools.product((category,), range(0, page_nr + 1))
-                      for page_nr, category in
-                      map(lambda task: task.result(), finished)]
-        cats_pages = tuple(itertools.chain.from_iterable(cats_pages))
-
-        log.debug(cats_pages)
-        f = asyncio.wait([scrape(semaphore=semaphore,
-                                 server=Server.BEFORE_BIG_BANG,
-                                 section=Section.MONSTER,
-                                 subsection=lvl,
-                                 page=page,
-                                 model=Monster)
-                          for lvl, page in cats_pages])
-        finished, pending = loop.run_until_complete(f)
+        loop.run_until_complete(self.refresh())
 
         if __name__ == '__main__':
+            self.close()
             loop.close()
 
-        if Weapon.select().count() > 0:
-            Weapon.delete().execute()
-        if Monster.select().count() > 0:
-            Monster.delete().execute()
-
-        with self.db.atomic():
-            for result, category in [task.result() for task in finished]:
-
-                model = type(category).related_model()
-
-                for i in range(0, len(result), self.max_bulk_rows):
-                    top = i + self.max_bulk_rows
-                    model.insert_many(result[i:top]).execute()
-
-                if len(result) == 0:
-                    log.warn('empty result set for {} category'.format(category))
+    @asyncio.coroutine
+    def refresh(self):
+        """Crawls a new generation of data. It is built in the shadow slot of the store while queries keep
+        being answered from the live one, then swapped in. Only the very first crawl goes to the live slot,
+        so that queries see rows as soon as they are ingested"""
+        log.info('refreshing data...')
+        pool_stats = self.session.stats()
+
+        slot, generation = yield from self.on_db_thread(self._begin_generation)
+        targets = plan_crawl([Server(s) for s in settings.CRAWL_SERVERS])
+        self.throughput = Throughput()
+
+        # the rate limiter caps requests per host, fetch workers only need to be enough to saturate the pool
+        self.pipeline = pipeline = CrawlPipeline(self.loop, self._discover, self._fetch, self._parse, self._ingest,
+                                                 workers=dict(fetch=settings.CRAWLER_POOL_SIZE,
+                                                              parse=max(1, settings.PARSER_PROCESSES)))
+        yield from pipeline.run(targets)
+        self.session.log_stats(since=pool_stats)
+        self.cache.log_stats()
+        self.throughput.log_stats('ingest throughput')
+
+        errors = sum(v for k, v in pipeline.counters.items() if k.endswith('errors'))
+        crawled = defaultdict(set)
+        for target in targets:
+            crawled[target.model].add(target.server.value)
+        published = yield from self.on_db_thread(self._complete_generation, slot, generation, errors, crawled)
 
-        self.db_refreshing = False
         log.info('refreshing data... done')
 
+        if published and not self.ready:
+            self.warmed_up.set()
+            log.info('data warm-up done in {:.2f}s'.format(time.monotonic() - self.created))
+
+    def _begin_generation(self) -> tuple:
+        slot = self.store.live if self.generation is None else self.store.open_shadow()
+        self.ingestor = Ingestor(slot.db, self.max_bulk_rows)
+        with bind(slot.db, [DataGeneration]):
+            generation = DataGeneration.create(generation=self.store.next_generation(), schema_version=SCHEMA_VERSION)
+        return slot, generation
+
+    def _complete_generation(self, slot: Slot, generation: DataGeneration, errors: int, crawled: dict) -> bool:
+        """Publishes generation, False when it failed instead. crawled are the servers crawled by model"""
+        if errors:
+            log.warn('{} crawl errors, rows missing from this crawl are not tombstoned'.format(errors))
+        else:
+            for model, servers in crawled.items():
+                self.ingestor.tombstone(model, servers)
+        self.ingestor.log_stats()
+
+        if self.pipeline.counters['ingest'] == 0:
+            log.error('nothing was crawled, keeping generation {}'.format(
+                self.generation.generation if self.generation else None))
+            self._fail_generation(slot, generation, errors)
+            return False
+        if errors and slot is not self.store.live and slot.generation is None:
+            # the shadow started empty, it only has what this crawl got
+            log.error('{} crawl errors on an empty shadow database, keeping generation {}'.format(
+                errors, self.generation.generation))
+            self._fail_generation(slot, generation, errors)
+            return False
+
+        with bind(slot.db, [DataGeneration]):
+            generation.completed = datetime.datetime.utcnow()
+            generation.errors = errors
+            generation.save()
+        slot.generation = generation
+        if slot is not self.store.live:
+            self.store.swap()
+        # entries of the previous generation cannot be hit anymore
+        self.query_cache.log_stats()
+        self.query_cache.clear()
+        self.prerender()
+        return True
+
+    def _fail_generation(self, slot: Slot, generation: DataGeneration, errors: int):
+        with bind(slot.db, [DataGeneration]):
+            generation.failed = True
+            generation.errors = errors
+            generation.save()
+        if slot is not self.store.live:
+            self.store.release(slot)
+
+    @asyncio.coroutine
+    def _discover(self, target: CrawlPage):
+        page_nr, _ = yield from last_page(session=self.session,
+                                          server=target.server,
+                                          section=target.section,
+                                          subsection=target.subsection,
+                                          category=target.category,
+                                          executor=self.executor,
+                                          parse=self.parse_last_page)
+        return [target._replace(page=page) for page in range(0, page_nr + 1)]
+
+    @asyncio.coroutine
+    def _fetch(self, target: CrawlPage):
+        page, rows = yield from fetch_page(session=self.session,
+                                           server=target.server,
+                                           section=target.section,
+                                           subsection=target.subsection,
+                                           category=target.category,
+                                           page=target.page,
+                                           parser=self.parser_tag)
+        return target, page, rows
+
+    @asyncio.coroutine
+    def _parse(self, item):
+        target, page, result = item
+        if result is not None:
+            log.debug('{} unchanged, parsing skipped'.format(target.url))
+            return target, result
+
+        result = yield from run_parser(self.executor, self.parse_page,
+                                       page, target.server, target.model, target.category)
+        self.cache.store_rows(target.url, result, self.parser_tag)
+        if target.category:
+            log.info('parsing of {} -> {} page {} done'.format(target.subsection, target.category, target.page))
+        else:
+            log.info('parsing of {} page {} done'.format(target.subsection, target.page))
+        return target, result
+
+    @asyncio.coroutine
+    def _ingest(self, item):
+        target, result = item
+        category = target.subsection if target.category is None else target.category
+        model = type(category).related_model()
+
+        yield from self.on_db_thread(self.ingestor.ingest, model,
+                                     [dict(row, server=target.server.value) for row in result])
+        self.throughput.add(target.server, len(result))
+
+        if len(result) == 0:
+            log.warn('empty result set for {} category page {}'.format(category, target.page))
+
+    @asyncio.coroutine
+    def on_db_thread(self, func, *args, **kwargs):
+        """Runs func on the database thread, where the bot does all of its database work. Queries,
+        ingest and swaps are serialized there, so none of them blocks the loop nor sees another one
+        halfway through"""
+        return (yield from self.loop.run_in_executor(self.db_thread, functools.partial(func, *args, **kwargs)))
+
+    def close(self):
+        self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.db_thread.shutdown(wait=True)
+        self.store.close()
+
+    @cached
     def monsters_by_name(self, monster_name: str, exact_match: bool=False):
-        if self.db_refreshing:
-            raise ValueError('Database refresh in progress')
-
-        keyw = monster_name if exact_match else '%{}%'.format(monster_name)
-
-        q = Monster.select().where(Monster.name ** keyw)
-        return q.execute()
-
+        """Monsters whose name is monster_name, or holds all of its words (as prefixes) unless
+        exact_match, best match first"""
+        with self.store.reading():
+            if not exact_match:
+                return search(Monster, monster_name, 'server = ?', (settings.DEFAULT_SERVER,))
+            return records(Monster.select().where((Monster.name ** monster_name) &
+                                                  (Monster.server == settings.DEFAULT_SERVER) &
+                                                  (Monster.deleted == False)))
+
+    @cached
     def maple_weapon_by_name(self, *weapon_name_terms):
-        if self.db_refreshing:
-            raise ValueError('Database refresh in progress')
-
-        clauses = [(MapleWeapon.name ** '%{}%'.format(term)) for term in weapon_name_terms]
-        return MapleWeapon.select().where(functools.reduce(operator.or_, clauses)).execute()
-
-    def maple_list_by_level(self, weapon_level: int=None):
-
-        if self.db_refreshing:
-            raise ValueError('DATABASE DATABASE REFRESHING THE DATABASE')
-
-        sq = (MapleWeapon
-              .select(MapleWeapon.required_level,
-                      peewee.fn.group_concat(MapleWeapon.name, ', ').alias('names')
-                      )
-              )
-
-        if weapon_level is not None:
-            sq = sq.where(MapleWeapon.required_level == weapon_level)
-
-        sq = sq.group_by(MapleWeapon.required_level)
-        return sq.execute()
+        """Maple weapons whose name holds all of the terms (as prefixes), best match first"""
+        with self.store.reading():
+            return search(MapleWeapon, ' '.join(weapon_name_terms))
+
+    def prerender(self):
+        """Renders the replies of every row answering commands, in every language, for the live generation"""
+        if self.generation is None or not messages.msg_map:
+            return
+        start = time.monotonic()
+        replies = self.store.derived('replies', lambda slot: Replies())
+        with self.store.reading():
+            replies.render_all(records(Monster.select().where((Monster.server == settings.DEFAULT_SERVER) &
+                                                              (Monster.deleted == False))), list(messages.msg_map))
+            replies.render_all(records(MapleWeapon.select()), list(messages.msg_map))
+        log.info('{} replies rendered in {:.1f}ms'.format(len(replies), (time.monotonic() - start) * 1000))
+
+    def replies(self, rows: list, lang: str=messages.DEFAULT_LANG) -> list:
+        """Reply texts of the rows a query just returned, rendered once per generation and language"""
+        replies = self.store.derived('replies', lambda slot: Replies())
+        return [replies.get(row, lang) for row in rows]
+
+    def similar_monster_names(self, monster_name: str, k: int=settings.FUZZY_SUGGESTIONS) -> list:
+        """Up to k (name, similarity) pairs of the monsters whose name is closest to monster_name"""
+        index = self.store.derived('monster names', lambda slot: TrigramIndex(
+            name for name, in (Monster.select(Monster.name)
+                               .where((Monster.server == settings.DEFAULT_SERVER) & (Monster.deleted == False))
+                               .tuples())))
+        return index.similar(monster_name, k)
+
+    def similar_maple_weapon_names(self, weapon_name: str, k: int=settings.FUZZY_SUGGESTIONS) -> list:
+        """Up to k (name, similarity) pairs of the maple weapons whose name is closest to weapon_name"""
+        index = self.store.derived('maple weapon names', lambda slot: TrigramIndex(
+            name for name, in MapleWeapon.select(MapleWeapon.name).tuples()))
+        return index.similar(weapon_name, k)
+
+    def complete_monster_names(self, prefix: str, n: int=settings.COMPLETIONS) -> list:
+        """Up to n monster names completing prefix, lowest level first"""
+        index = self.store.derived('monster completions', lambda slot: PrefixIndex(
+            Monster.select(Monster.name, Monster.level)
+                   .where((Monster.server == settings.DEFAULT_SERVER) & (Monster.deleted == False))
+                   .tuples()))
+        return index.complete(prefix, n)
+
+    def complete_maple_weapon_names(self, prefix: str, n: int=settings.COMPLETIONS) -> list:
+        """Up to n maple weapon names completing prefix, lowest required level first"""
+        index = self.store.derived('maple weapon completions', lambda slot: PrefixIndex(
+            MapleWeapon.select(MapleWeapon.name, MapleWeapon.required_level).tuples()))
+        return index.complete(prefix, n)
+
+    def rank_monsters(self, score: str, min_level: int=None, max_level: int=None, k: int=settings.RANKING_SIZE,
+                      server: str=settings.DEFAULT_SERVER) -> list:
+        """Best k monsters of server by score (see ranking.SCORES), within the level window when given"""
+        table = self.store.derived('monster table {}'.format(server),
+                                   lambda slot: MonsterTable(MonsterTable.query(server)))
+        return table.rank(score, min_level, max_level, k)
+
+    def maple_list_by_level(self, weapon_level: int=None, max_level: int=None) -> list:
+        """Maple weapon names by required level, for every level, weapon_level only or weapon_level up to
+        max_level. Listed once when the catalogue is loaded, so there is no need to go to the database"""
+        return self.maple_catalogue.levels(weapon_level, max_level)
+
+    # for the bot, the synchronous ones are for scripts
+    monsters_by_name_async = awaitable(monsters_by_name)
+    maple_weapon_by_name_async = awaitable(maple_weapon_by_name)
+    similar_monster_names_async = awaitable(similar_monster_names)
+    similar_maple_weapon_names_async = awaitable(similar_maple_weapon_names)
+    complete_monster_names_async = awaitable(complete_monster_names)
+    complete_maple_weapon_names_async = awaitable(complete_maple_weapon_names)
+    rank_monsters_async = awaitable(rank_monsters)
+    replies_async = awaitable(replies)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import settings
+from collections import Counter, defaultdict
+from entities.models import bind, CrawledModel
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+
+def row_hash(row: dict) -> str:
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Ingestor:
+    """Differential ingest of crawled rows.
+
+    Rows are matched by server and hiddenstreet_alias against what is
+    already stored: new ones are inserted, the ones whose content hash
+    changed are updated and the others are left alone. Once a whole crawl went through, rows
+    of the crawled servers that were not seen anymore are tombstoned. Rows go to db, which needs
+    not be the database readers are currently using."""
+
+    def __init__(self, db, max_bulk_rows: int=20):
+        self.db = db
+        self.max_bulk_rows = max_bulk_rows
+        self.counters = Counter()
+        self.seen = defaultdict(set)
+
+    def ingest(self, model: CrawledModel, rows: list):
+        hashed = {(row['server'], row['hiddenstreet_alias']): (row_hash(row), row) for row in rows}
+        by_server = defaultdict(list)
+        for server, alias in hashed:
+            by_server[server].append(alias)
+        inserts = []
+
+        with bind(self.db, [model]), self.db.atomic():
+            for server, server_aliases in by_server.items():
+                for i in range(0, len(server_aliases), self.max_bulk_rows):
+                    aliases = server_aliases[i:i + self.max_bulk_rows]
+                    stored = {alias: (digest, deleted) for alias, digest, deleted in
+                              model.select(model.hiddenstreet_alias, model.content_hash, model.deleted)
+                              .where((model.server == server) & (model.hiddenstreet_alias << aliases)).tuples()}
+
+                    for alias in aliases:
+                        digest, row = hashed[(server, alias)]
+                        self.seen[model].add((server, alias))
+                        if alias not in stored:
+                            inserts.append(dict(row, content_hash=digest, deleted=False))
+                            self.counters['inserted'] += 1
+                        elif stored[alias] != (digest, False):
+                            model.update(content_hash=digest, deleted=False, **row) \
+                                 .where((model.server == server) & (model.hiddenstreet_alias == alias)).execute()
+                            self.counters['updated'] += 1
+                        else:
+                            self.counters['unchanged'] += 1
+
+            for i in range(0, len(inserts), self.max_bulk_rows):
+                model.insert_many(inserts[i:i + self.max_bulk_rows]).execute()
+
+    def tombstone(self, model: CrawledModel, servers: set):
+        """Tombstones the rows of the crawled servers that were not seen, rows of other servers are kept"""
+        with bind(self.db, [model]), self.db.atomic():
+            pk = model._meta.primary_key
+            alive = model.select(pk, model.server, model.hiddenstreet_alias) \
+                         .where((model.server << list(servers)) & (model.deleted == False))
+            gone = [id_ for id_, server, alias in alive.tuples() if (server, alias) not in self.seen[model]]
+
+            for i in range(0, len(gone), self.max_bulk_rows):
+                model.update(deleted=True).where(pk << gone[i:i + self.max_bulk_rows]).execute()
+        self.counters['deleted'] += len(gone)
+
+    def log_stats(self):
+        log.info('ingest: {inserted} inserted, {updated} updated, {deleted} deleted, {unchanged} unchanged'.format(
+            **{k: self.counters[k] for k in ('inserted', 'updated', 'deleted', 'unchanged')}))
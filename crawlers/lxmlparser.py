@@ -0,0 +1,264 @@
+"""Parser backend built directly on lxml.
+
+Same rows as the BeautifulSoup functions in hiddenstreet.py, but every
+lookup is a precompiled XPath expression evaluated by libxml2 instead of a
+walk through BeautifulSoup's tree API. Selected with PARSER_BACKEND = 'lxml'.
+"""
+from lxml import etree
+from typing import Generic, Optional
+from entities.models import Monster, Weapon
+from entities.enums import Server
+
+
+def _has_class(cls: str) -> str:
+    return 'contains(concat(" ", normalize-space(@class), " "), " {} ")'.format(cls)
+
+
+_parser = etree.HTMLParser(encoding='utf-8')
+
+tables = {
+    Server.BEFORE_BIG_BANG: etree.XPath('//table[{}]'.format(_has_class('monster'))),
+    None: etree.XPath('//table[{}]'.format(_has_class('database-info')))
+}
+cells_of = etree.XPath('.//td')
+divs_of = etree.XPath('.//div')
+child_divs_of = etree.XPath('./div')
+field_item_of = etree.XPath('(.//div[{}])[1]'.format(_has_class('field-item')))
+label_inline_of = etree.XPath('(.//div[{}])[1]'.format(_has_class('field-label-inline')))
+first_div_of = etree.XPath('(.//div)[1]')
+first_strong_of = etree.XPath('(.//strong)[1]')
+child_strong_of = etree.XPath('./strong[1]')
+first_a_of = etree.XPath('(.//a)[1]')
+img_src_of = etree.XPath('(.//img)[1]/@src', smart_strings=False)
+pager_last_href = etree.XPath('(//li[{}])[1]/descendant::a[1]/@href'.format(_has_class('pager-last')),
+                              smart_strings=False)
+
+
+def _first(xpath, el):
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def contents(el) -> list:
+    """Children of el the way BeautifulSoup's Tag.contents sees them: text nodes and elements in document order"""
+    result = [el.text] if el.text else []
+    for child in el:
+        result.append(child.text or '' if isinstance(child, etree._Comment) else child)
+        if child.tail:
+            result.append(child.tail)
+    return result
+
+
+def string(el) -> Optional[str]:
+    """Equivalent of BeautifulSoup's Tag.string"""
+    children = contents(el)
+    if len(children) != 1:
+        return None
+    child = children[0]
+    return child if isinstance(child, str) else string(child)
+
+
+def _last_text(el) -> Optional[str]:
+    children = contents(el)
+    return children[-1].strip() if children and isinstance(children[-1], str) else None
+
+
+def convert(el, field_type: Generic(str, int)=str, strip_comma=False):
+    result = _first(field_item_of, el)
+    if result is not None:
+        result = string(result)
+    else:
+        div = _first(first_div_of, el)
+        if div is not None and 'field-label-inline' in (div.get('class') or '').split():
+            result = _last_text(div)
+        else:
+            result = _last_text(el)
+    return cast(result, field_type, strip_comma)
+
+
+def cast(result: Optional[str], field_type: Generic(str, int)=str, strip_comma=False):
+    if field_type == str:
+        if result == '-' or result == '?':
+            result = None
+    elif result is not None:
+        if strip_comma:
+            result = result.replace(',', '')
+        try:
+            result = field_type(result)
+        except ValueError:
+            result = None
+    return result
+
+
+def parse_monster_tag(tag, *args):
+    cells = cells_of(tag)
+    equipment = child_divs_of(cells[7])
+    stats = child_divs_of(cells[11])
+    magic = child_divs_of(cells[12])
+    special = child_divs_of(cells[13])
+    statuses = child_divs_of(cells[14])
+    link = first_a_of(_first(label_inline_of, cells[0]))[0]
+    image_url = img_src_of(cells[0])
+    level = _first(child_strong_of, cells[0])
+    level = string(level) if level is not None else None
+    try:
+        level = int(level.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        level = None
+
+    return dict(hiddenstreet_alias=link.get('href').split('/')[-1],
+                name=string(first_strong_of(link)[0]),
+                level=level,
+                health_points=convert(cells[1], int),
+                mana_points=convert(cells[2], int),
+                experience=convert(cells[3], int),
+                mesos=convert(cells[4], int),
+                knockback=convert(cells[5], int),
+                etc_drop=convert(cells[6]),
+                common_equipment=convert(equipment[0]),
+                warrior_equipment=convert(equipment[1]),
+                magician_equipment=convert(equipment[2]),
+                bowman_equipment=convert(equipment[3]),
+                thief_equipment=convert(equipment[4]),
+                pirate_equipment=convert(equipment[5]),
+                ore_drop=convert(cells[8]),
+                maker_item=convert(cells[9]),
+                useable_drop=convert(cells[10]),
+                weapon_attack=convert(stats[0], int),
+                magic_attack=convert(stats[1], int),
+                weapon_defence=convert(stats[2], int),
+                magic_defence=convert(stats[3], int),
+                phisical_dmg_reduction=convert(stats[4], int),
+                magical_dmg_reduction=convert(stats[5], int),
+                speed=convert(stats[6], int),
+                accuracy=convert(stats[7], int),
+                avoidability=convert(stats[8], int),
+                normal_to_magic=None,
+                weakness_to_magic=convert(magic[0]),
+                resistance_to_magic=convert(magic[1]),
+                immune_to_magic=convert(magic[2]),
+                unique_attack=convert(special[0]),
+                health_points_recovery=convert(special[1], int),
+                mana_points_recovery=convert(special[2], int),
+                immune_against_status=convert(statuses[0]),
+                inflict_status=convert(statuses[1]),
+                common_location=None,
+                image_url=image_url[0] if image_url else None)
+
+
+def parse_monster_bbb_tag(tag, *args):
+    cells = cells_of(tag)
+    equipment = divs_of(cells[7])
+    stats = divs_of(cells[11])
+    magic = divs_of(cells[12])
+    special = divs_of(cells[13])
+    statuses = divs_of(cells[14])
+    monster = dict(hiddenstreet_alias=tag.get('id'),
+                   name=string(first_strong_of(cells[0])[0]).strip(),
+                   level=_last_text(cells[0]),
+                   health_points=convert(cells[1], int, True),
+                   mana_points=convert(cells[2], int, True),
+                   experience=convert(cells[3], int, True),
+                   mesos=convert(cells[4], int, True),
+                   knockback=convert(cells[5], int),
+                   etc_drop=convert(cells[6]),
+                   common_equipment=convert(equipment[0]),
+                   warrior_equipment=convert(equipment[1]),
+                   magician_equipment=convert(equipment[2]),
+                   bowman_equipment=convert(equipment[3]),
+                   thief_equipment=convert(equipment[4]),
+                   pirate_equipment=convert(equipment[5]),
+                   ore_drop=convert(cells[8]),
+                   maker_item=convert(cells[9]),
+                   useable_drop=convert(cells[10]),
+                   weapon_attack=convert(stats[0], int),
+                   magic_attack=convert(stats[1], int),
+                   weapon_defence=convert(stats[2], int),
+                   magic_defence=convert(stats[3], int),
+                   phisical_dmg_reduction=convert(stats[4], int),
+                   magical_dmg_reduction=convert(stats[5], int),
+                   speed=convert(stats[6], int),
+                   accuracy=convert(stats[7], int),
+                   avoidability=convert(stats[8], int),
+                   weakness_to_magic=convert(magic[0]),
+                   normal_to_magic=convert(magic[1]),
+                   resistance_to_magic=convert(magic[2]),
+                   immune_to_magic=convert(magic[3]),
+                   unique_attack=convert(special[0]),
+                   health_points_recovery=convert(special[1], int),
+                   mana_points_recovery=convert(special[2], int),
+                   immune_against_status=convert(statuses[0]),
+                   inflict_status=convert(statuses[1]),
+                   common_location=None)
+
+    image_url = img_src_of(cells[0])
+    monster['image_url'] = image_url[0] if image_url else None
+    try:
+        monster['level'] = int(monster['level'])
+    except (TypeError, ValueError):
+        monster['level'] = None
+    return monster
+
+
+def parse_weapon_tag(tag, weapon_type):
+    cells = cells_of(tag)
+    link = first_a_of(first_strong_of(cells[1])[0])[0]
+    weapon = dict(hiddenstreet_alias=link.get('href').split('/')[-1],
+                  name=string(link),
+                  weapon_type=weapon_type.value,
+                  required_level=convert(cells[2], int),
+                  required_stats=convert(cells[3]),
+                  weapon_attack=convert(cells[4], int),
+                  attack_speed=convert(cells[5]),
+                  job=convert(cells[6]),
+                  effects=convert(cells[7]),
+                  available_upgrades=convert(cells[8], int),
+                  sold_for=convert(cells[9]),
+                  dropped_by=convert(cells[10]),
+                  available_from=None,
+                  remarks=None)
+
+    try:
+        tmp = weapon['sold_for'].index(' ')
+        weapon['sold_for'] = int(weapon['sold_for'][:tmp].replace(',', ''))
+    except (AttributeError, ValueError):
+        weapon['sold_for'] = 0
+    return weapon
+
+
+parse_funcs = {
+    (Server.BEFORE_BIG_BANG, Monster): parse_monster_bbb_tag,
+    (Server.GLOBAL, Monster): parse_monster_tag,
+    (Server.EUROPE, Monster): parse_monster_tag,
+    (Server.KOREA, Monster): parse_monster_tag,
+    (Server.JAPAN, Monster): parse_monster_tag,
+    (Server.SOUTH_EAST_ASIA, Monster): parse_monster_tag,
+    (Server.CHINA, Monster): parse_monster_tag,
+    (Server.TAIWAN, Monster): parse_monster_tag,
+    (Server.BEFORE_BIG_BANG, Weapon): lambda *p: ...,  # still NOOP, as in the BeautifulSoup backend
+    (Server.GLOBAL, Weapon): parse_weapon_tag,
+    (Server.EUROPE, Weapon): parse_weapon_tag,
+    (Server.KOREA, Weapon): parse_weapon_tag,
+    (Server.JAPAN, Weapon): parse_weapon_tag,
+    (Server.SOUTH_EAST_ASIA, Weapon): parse_weapon_tag,
+    (Server.CHINA, Weapon): parse_weapon_tag,
+    (Server.TAIWAN, Weapon): parse_weapon_tag
+}
+
+
+def parse_page(page: str, server: Server, model, category=None):
+    root = etree.fromstring(page.encode('utf-8'), _parser)
+    if root is None:
+        return []
+    parse = parse_funcs[(server, model)]
+    return [parse(tag, category) for tag in tables[server if server == Server.BEFORE_BIG_BANG else None](root)]
+
+
+def parse_last_page(page: str, server: Server) -> int:
+    root = etree.fromstring(page.encode('utf-8'), _parser)
+    found = pager_last_href(root)
+    if not found:
+        # a single page, no pager
+        return 0
+    last_page_href = found[0]
+    return int(last_page_href[last_page_href.index('page=') + 5:])
@@ -0,0 +1,88 @@
+"""Maple Weapon catalogue.
+
+The catalogue is edited in mapleweapons.csv, then compiled into
+mapleweapons.json with the values typed after the MapleWeapon fields:
+
+    python -m crawlers.mapleweapons
+
+The bot reads the compiled file once, every database slot gets it in a
+single statement, and the names by required level are listed at load time.
+"""
+import csv
+import json
+import os
+import peewee
+from collections import OrderedDict, namedtuple
+from entities.models import MapleWeapon
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), 'mapleweapons.csv')
+ARTIFACT_PATH = os.path.join(os.path.dirname(__file__), 'mapleweapons.json')
+
+LevelNames = namedtuple('LevelNames', ('required_level', 'names'))
+
+
+def _typed(field: peewee.Field, value: str):
+    if value == '' and field.null:
+        return None
+    if isinstance(field, peewee.IntegerField):
+        return int(value)
+    return value
+
+
+def compile_catalogue(path: str=CSV_PATH) -> dict:
+    """Columns and typed rows of the catalogue in the CSV file at path"""
+    with open(path, encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        columns = [name for name in MapleWeapon._meta.sorted_field_names if name in reader.fieldnames]
+        fields = [MapleWeapon._meta.fields[name] for name in columns]
+        rows = [[_typed(field, row[field.name]) for field in fields] for row in reader]
+    return dict(columns=columns, rows=rows)
+
+
+class Catalogue:
+    """Compiled catalogue, with the names of the weapons by required level"""
+
+    def __init__(self, columns: list, rows: list):
+        self.columns = columns
+        self.rows = rows
+        level = columns.index('required_level')
+        name = columns.index('name')
+        by_level = OrderedDict()
+        for row in sorted(rows, key=lambda r: r[level]):
+            by_level.setdefault(row[level], []).append(row[name])
+        self.by_level = OrderedDict((lvl, LevelNames(lvl, ', '.join(names))) for lvl, names in by_level.items())
+
+    @classmethod
+    def load(cls, path: str=ARTIFACT_PATH) -> 'Catalogue':
+        with open(path, encoding='utf-8') as f:
+            return cls(**json.load(f))
+
+    def levels(self, minimum: int=None, maximum: int=None) -> list:
+        """Names by required level, for every level or the ones from minimum to maximum (included)"""
+        if minimum is None:
+            return list(self.by_level.values())
+        if maximum is None:
+            return [self.by_level[minimum]] if minimum in self.by_level else []
+        return [names for level, names in self.by_level.items() if minimum <= level <= maximum]
+
+    def insert(self, db):
+        """Inserts every weapon into the MapleWeapon table of db"""
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(MapleWeapon._meta.db_table,
+                                                       ', '.join(MapleWeapon._meta.fields[c].db_column
+                                                                 for c in self.columns),
+                                                       ', '.join('?' * len(self.columns)))
+        db.get_cursor().executemany(sql, self.rows)
+
+
+def main():
+    catalogue = compile_catalogue()
+    with open(ARTIFACT_PATH, 'w', encoding='utf-8') as f:
+        # a row per line, for readable diffs
+        f.write('{{"columns": {},\n "rows": [\n'.format(json.dumps(catalogue['columns'])))
+        f.write(',\n'.join('  {}'.format(json.dumps(row, ensure_ascii=False)) for row in catalogue['rows']))
+        f.write('\n]}\n')
+    print('{} compiled to {}'.format(CSV_PATH, ARTIFACT_PATH))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import bisect
+import heapq
+import re
+from collections import Counter, defaultdict
+
+_words = re.compile(r'\w+')
+
+
+def normalize(name: str) -> str:
+    return ' '.join(_words.findall(name.casefold()))
+
+
+def trigrams(text: str) -> set:
+    padded = '  {} '.format(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def pattern(text: str) -> dict:
+    """Bit mask of the positions of every character of text"""
+    masks = {}
+    for i, c in enumerate(text):
+        masks[c] = masks.get(c, 0) | 1 << i
+    return masks
+
+
+def distance(a: str, b: str, masks: dict=None) -> int:
+    """Edit distance, counting the transposition of two adjacent characters as one edit.
+    Bit parallel (Myers' algorithm with Hyyro's transpositions), masks being pattern(a)"""
+    if not a:
+        return len(b)
+    if masks is None:
+        masks = pattern(a)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    vp, vn, d0, previous = full, 0, 0, 0
+    score = len(a)
+    for c in b:
+        match = masks.get(c, 0)
+        transposed = (((~d0) & match) << 1) & previous
+        d0 = ((((match & vp) + vp) ^ vp) | match | vn | transposed) & full
+        hp = (vn | ~(d0 | vp)) & full
+        hn = d0 & vp
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        hp = (hp << 1 | 1) & full
+        hn = (hn << 1) & full
+        vp = (hn | ~(d0 | hp)) & full
+        vn = hp & d0
+        previous = match
+    return score
+
+
+class TrigramIndex:
+    """Typo tolerant lookup of names.
+
+    Names sharing the most trigrams with the query are the candidates, which
+    are then ranked by edit distance, so that both missing letters
+    ("zakkum") and swapped ones ("horntial") end up next to the right name.
+    Built once per generation of data, lookups do not touch the database."""
+
+    def __init__(self, names, candidates: int=10, minimum: float=0.4, minimum_dice: float=0.2):
+        self.names = sorted(set(names))
+        self.normalized = [normalize(name) for name in self.names]
+        self.candidates = candidates
+        self.minimum = minimum
+        self.minimum_dice = minimum_dice
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for i, name in enumerate(self.normalized):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for trigram in grams:
+                self.postings[trigram].append(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def similar(self, query: str, k: int=5) -> list:
+        """Up to k (name, similarity) pairs, the most similar first, similarity going from minimum to 1"""
+        query = normalize(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+        shared = Counter()
+        for trigram in grams:
+            shared.update(self.postings.get(trigram, ()))
+        # by Dice coefficient, the ones sharing barely a trigram or two are not worth an edit distance
+        candidates = sorted(((2 * common / (len(grams) + self.sizes[i]), i, common)
+                             for i, common in shared.most_common(self.candidates)), reverse=True)
+
+        # the k best so far, the least similar first
+        best = []
+        masks = pattern(query)
+        for dice, i, common in candidates:
+            if dice < self.minimum_dice:
+                break
+            name = self.normalized[i]
+            similarity = 1 - distance(query, name, masks) / max(len(query), len(name))
+            if similarity < self.minimum:
+                continue
+            scored = (similarity, common, self.names[i])
+            if len(best) < k:
+                heapq.heappush(best, scored)
+            else:
+                heapq.heappushpop(best, scored)
+        return [(name, round(similarity, 3)) for similarity, _, name in sorted(best, reverse=True)]
+
+
+class PrefixIndex:
+    """Completion of partial names.
+
+    Every word of a name starts a key, so that 'cla' completes 'Maple
+    Claw' as well as 'map cl' does, each word of the query being the start
+    of a word of the name. Keys are kept sorted, the ones starting with the
+    first word of the query being a contiguous slice found by bisection,
+    and completions come out ordered by rank (the level, names without one
+    last). Built once per generation of data."""
+
+    def __init__(self, entries):
+        ranked = {}
+        for name, rank in entries:
+            rank = rank if rank is not None else float('inf')
+            ranked[name] = min(rank, ranked.get(name, rank))
+        self.keys = []
+        for name, rank in ranked.items():
+            words = normalize(name).split(' ')
+            for i in range(len(words)):
+                self.keys.append((' '.join(words[i:]), rank, name, words[i:]))
+        self.keys.sort(key=lambda k: k[:3])
+        # slices are searched by key only
+        self.prefixes = [key for key, _, _, _ in self.keys]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def complete(self, prefix: str, n: int=10) -> list:
+        """Up to n names having words starting with the words of prefix, lowest rank first"""
+        words = normalize(prefix).split(' ')
+        if not words[0]:
+            return []
+        start = bisect.bisect_left(self.prefixes, words[0])
+        # the last key starting with the word sorts before the word followed by the highest code point
+        end = bisect.bisect_left(self.prefixes, words[0] + '\U0010ffff', start)
+        # a name is in the slice once per word matching
+        matches = {(rank, name) for _, rank, name, key in self.keys[start:end]
+                   if len(words) == 1 or _starts_words(key, words)}
+        return [name for _, name in heapq.nsmallest(n, matches)]
+
+
+def _starts_words(key: list, words: list) -> bool:
+    return len(key) >= len(words) and all(k.startswith(w) for k, w in zip(key, words))
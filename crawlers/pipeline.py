@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+import settings
+from collections import Counter
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+_DONE = object()
+
+
+class CrawlPipeline:
+    """Producer/consumer crawl: discover -> fetch -> parse -> ingest.
+
+    Each stage is a pool of workers connected to the next one by a bounded
+    queue, so a slow stage applies backpressure to the previous ones and
+    items flow through the whole chain as soon as they are available.
+    Every stage callable is a coroutine taking one item and returning the
+    item for the next stage (or None to drop it), the discover stage returns
+    an iterable of items instead."""
+
+    stages = ('discover', 'fetch', 'parse', 'ingest')
+
+    def __init__(self, loop, discover, fetch, parse, ingest, workers: dict=None, queue_size: int=None):
+        self.loop = loop
+        self.funcs = dict(discover=discover, fetch=fetch, parse=parse, ingest=ingest)
+        self.workers = dict(fetch=5, parse=1, ingest=1)
+        self.workers.update(workers or {})
+        self.queue_size = settings.CRAWLER_QUEUE_SIZE if queue_size is None else queue_size
+        self.counters = Counter()
+        self.busy = Counter()  # time in seconds spent in each stage callable, summed over workers
+        self.elapsed = 0.0
+
+    @asyncio.coroutine
+    def run(self, targets):
+        start = time.monotonic()
+        self.counters.clear()
+        self.busy.clear()
+        fetch_q, parse_q, ingest_q = [asyncio.Queue(self.queue_size, loop=self.loop) for _ in range(3)]
+
+        discoverers = [self._discover(target, fetch_q) for target in targets]
+        chain = ((discoverers, fetch_q),
+                 (self._workers('fetch', fetch_q, parse_q), parse_q),
+                 (self._workers('parse', parse_q, ingest_q), ingest_q),
+                 (self._workers('ingest', ingest_q), None))
+
+        # every stage runs concurrently, a stage is told to stop by the previous one
+        # only when all of its workers are done, one sentinel for each of the next workers
+        yield from asyncio.gather(*[self._stop_after(tasks, outbox, stage)
+                                    for (tasks, outbox), stage in zip(chain, self.stages[1:] + (None,))],
+                                  loop=self.loop)
+        self.elapsed = time.monotonic() - start
+        log.info('crawl pipeline: {} in {:.2f}s'.format(
+            ', '.join('{} {}'.format(v, k) for k, v in sorted(self.counters.items())), self.elapsed))
+
+    @asyncio.coroutine
+    def _stop_after(self, tasks, outbox, next_stage):
+        yield from asyncio.gather(*tasks, loop=self.loop)
+        if next_stage is not None:
+            for _ in range(self.workers[next_stage]):
+                yield from outbox.put(_DONE)
+
+    def _workers(self, stage, inbox, outbox=None):
+        return [self._work(stage, inbox, outbox) for _ in range(self.workers[stage])]
+
+    @asyncio.coroutine
+    def _discover(self, target, outbox):
+        try:
+            items = yield from self.funcs['discover'](target)
+        except Exception:
+            self.counters['discover errors'] += 1
+            log.exception('discover stage failed for {!r:.200}'.format(target))
+            return
+        for item in items:
+            self.counters['discovered'] += 1
+            yield from outbox.put(item)
+
+    @asyncio.coroutine
+    def _work(self, stage, inbox, outbox):
+        func = self.funcs[stage]
+        while True:
+            item = yield from inbox.get()
+            if item is _DONE:
+                break
+            start = time.monotonic()
+            try:
+                result = yield from func(item)
+            except Exception:
+                self.counters['{} errors'.format(stage)] += 1
+                log.exception('{} stage failed for {!r:.200}'.format(stage, item))
+                continue
+            finally:
+                self.busy[stage] += time.monotonic() - start
+            self.counters[stage] += 1
+            if outbox is not None and result is not None:
+                yield from outbox.put(result)
+
+
+class Throughput:
+    """Pages and rows that went through a stage, by key (e.g. the server they come from).
+    Rates are over the time from the start to the last item seen for each key"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.pages = Counter()
+        self.rows = Counter()
+        self.last = {}
+
+    def add(self, key, rows: int):
+        self.pages[key] += 1
+        self.rows[key] += rows
+        self.last[key] = time.monotonic()
+
+    def log_stats(self, label: str):
+        for key in sorted(self.pages, key=str):
+            elapsed = max(self.last[key] - self.start, 1e-6)
+            log.info('{} {}: {} pages, {} rows in {:.2f}s ({:.1f} pages/s, {:.1f} rows/s)'.format(
+                label, key, self.pages[key], self.rows[key], elapsed,
+                self.pages[key] / elapsed, self.rows[key] / elapsed))
@@ -0,0 +1,110 @@
+import functools
+import logging
+import sys
+import time
+import settings
+from collections import Counter, OrderedDict
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+
+def normalize(value):
+    """Strings differing only by case or spacing make the same query"""
+    if isinstance(value, str):
+        return ' '.join(value.casefold().split())
+    return value
+
+
+def footprint(value, seen: set=None) -> int:
+    """Approximate bytes taken by value, following containers and instance attributes"""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(footprint(k, seen) + footprint(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(footprint(v, seen) for v in value)
+    elif hasattr(value, '__dict__'):
+        size += footprint(vars(value), seen)
+    return size
+
+
+class QueryCache:
+    """LRU cache of query results, keyed by the data generation they were answered from.
+
+    A new generation makes every older entry unreachable at once, clear()
+    then frees them. Entries also expire after ttl seconds. Results are
+    shared between callers, which must not modify them."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.counters = Counter()
+
+    def get(self, key, generation: int, compute):
+        """Result of compute() for key in generation, computed only when not cached.
+        Nothing is cached without a generation, while the first one is being ingested"""
+        if generation is None or self.max_entries <= 0:
+            self.counters['uncached'] += 1
+            return compute()
+
+        key = (generation, key)
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, size, expires = entry
+            if expires > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return value
+            self._remove(key)
+            self.counters['expired'] += 1
+
+        self.counters['misses'] += 1
+        value = compute()
+        size = footprint(value)
+        self.entries[key] = value, size, time.monotonic() + self.ttl
+        self.bytes += size
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.counters['evicted'] += 1
+        return value
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters,
+                    entries=len(self.entries),
+                    bytes=self.bytes,
+                    hit_ratio=round(self.counters['hits'] / lookups, 3) if lookups else 0.0)
+
+    def log_stats(self):
+        log.info('query cache: {hit_ratio:.1%} hits ({hits} of {lookups}), {entries} entries, {kib:.1f}KiB, '
+                 '{evicted} evicted, {expired} expired'.format(
+                     lookups=self.counters['hits'] + self.counters['misses'],
+                     kib=self.bytes / 1024,
+                     **dict(self.stats(), **{k: self.counters[k] for k in ('hits', 'evicted', 'expired')})))
+
+
+def cached(method):
+    """Caches the results of a query method of an object having query_cache and generation attributes,
+    by method name and normalized arguments"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__,
+               tuple(normalize(arg) for arg in args),
+               tuple(sorted((name, normalize(arg)) for name, arg in kwargs.items())))
+        generation = self.generation.generation if self.generation is not None else None
+        return self.query_cache.get(key, generation, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,67 @@
+import numpy
+import settings
+from collections import OrderedDict, namedtuple
+from entities.models import Monster
+
+# columns of the monsters kept as arrays, missing values being NaN
+COLUMNS = ('level', 'health_points', 'experience', 'mesos', 'weapon_defence', 'magic_defence', 'accuracy',
+           'avoidability')
+
+# score name: function of the column arrays, the higher the better
+SCORES = OrderedDict([
+    ('exp', lambda c: c['experience'] * settings.EXP_RATE / c['health_points']),
+    ('mesos', lambda c: c['mesos'] / c['health_points']),
+    ('expdef', lambda c: c['experience'] * settings.EXP_RATE / (c['health_points'] + c['weapon_defence'])),
+])
+
+Ranked = namedtuple('Ranked', ('name', 'level', 'score'))
+
+
+class MonsterTable:
+    """The monsters of a generation of data as column arrays, ranked with vectorized scores.
+
+    Scores are computed for all the monsters at once, filtered by level
+    window and the best k picked with a partial sort, so a ranking takes
+    about the same time whatever the number of monsters."""
+
+    def __init__(self, rows):
+        """rows are (name, *COLUMNS) tuples"""
+        rows = list(rows)
+        self.names = numpy.array([row[0] for row in rows], dtype=object)
+        values = numpy.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(COLUMNS))
+        self.columns = {name: values[:, i] for i, name in enumerate(COLUMNS)}
+        self.scores = {}
+
+    @classmethod
+    def query(cls, server: str):
+        return (Monster.select(Monster.name, *[getattr(Monster, column) for column in COLUMNS])
+                       .where((Monster.server == server) & (Monster.deleted == False))
+                       .tuples())
+
+    def __len__(self):
+        return len(self.names)
+
+    def score(self, name: str) -> numpy.ndarray:
+        """Scores of every monster, NaN where a column is missing, computed once"""
+        if name not in self.scores:
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                score = SCORES[name](self.columns)
+            score[~numpy.isfinite(score)] = numpy.nan
+            self.scores[name] = score
+        return self.scores[name]
+
+    def rank(self, score: str, min_level: int=None, max_level: int=None, k: int=10) -> list:
+        """Best k monsters by score, within the level window when given"""
+        scores = self.score(score)
+        mask = ~numpy.isnan(scores)
+        level = self.columns['level']
+        if min_level is not None:
+            mask &= level >= min_level
+        if max_level is not None:
+            mask &= level <= max_level
+        candidates = numpy.flatnonzero(mask)
+        if len(candidates) > k:
+            candidates = candidates[numpy.argpartition(-scores[candidates], k - 1)[:k]]
+        best = candidates[numpy.argsort(-scores[candidates], kind='mergesort')]
+        return [Ranked(self.names[i], None if numpy.isnan(level[i]) else int(level[i]), float(scores[i]))
+                for i in best]
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import random
+import time
+import settings
+from collections import Counter
+from aiohttp import ClientError, hdrs
+from urllib.parse import urlsplit
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+# statuses telling the server is overloaded or throttling us, worth another try after a while
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class CrawlError(Exception):
+    """A page could not be fetched, even after retrying"""
+
+    def __init__(self, url: str, reason):
+        super().__init__('{} failed: {}'.format(url, reason))
+        self.url = url
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the requests in flight to a single host.
+
+    Every request answered on time and without throttling raises the limit
+    by 1 / limit (about one more request per round of responses), a
+    throttling response, a timeout or a response slower than
+    target_latency halves it. Decreases happen at most once per
+    target_latency, so a burst of slow responses counts as one signal."""
+
+    def __init__(self, loop, initial: float, minimum: float, maximum: float, target_latency: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.loop = loop
+        self._waiters = []
+
+    @asyncio.coroutine
+    def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = self.loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                yield from waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self, latency: float, congested: bool):
+        now = time.monotonic()
+        if congested or latency > self.target_latency:
+            if now - self.last_decrease > self.target_latency:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.in_flight -= 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class RetryBudget:
+    """Caps retries to a ratio of the requests made, plus a fixed allowance, so that
+    a site in trouble is not hit by a storm of retries on top of the regular crawl"""
+
+    def __init__(self, ratio: float, minimum: int):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = 0
+        self.retries = 0
+
+    def spend(self) -> bool:
+        if self.retries >= self.minimum + self.ratio * self.requests:
+            return False
+        self.retries += 1
+        return True
+
+
+class RateLimiter:
+    """Per host adaptive limiters, with retries on jittered exponential backoff"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.hosts = {}
+        self.budget = RetryBudget(settings.CRAWLER_RETRY_BUDGET, settings.CRAWLER_RETRIES)
+        self.counters = Counter()
+
+    def limiter(self, url: str) -> AdaptiveLimiter:
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = AdaptiveLimiter(self.loop,
+                                               initial=settings.CRAWLER_INITIAL_CONCURRENCY,
+                                               minimum=1,
+                                               maximum=settings.CRAWLER_POOL_PER_HOST,
+                                               target_latency=settings.CRAWLER_TARGET_LATENCY)
+        return self.hosts[host]
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: str=None) -> float:
+        try:
+            return min(settings.CRAWLER_BACKOFF_MAX, float(retry_after))
+        except (TypeError, ValueError):
+            delay = min(settings.CRAWLER_BACKOFF_MAX, settings.CRAWLER_BACKOFF_BASE * 2 ** attempt)
+            return random.uniform(delay / 2, delay)
+
+    @asyncio.coroutine
+    def request(self, url: str, send):
+        """Calls the send coroutine function, which returns a (status, headers, ...) tuple, under the
+        limiter of the host of url. Timeouts, connection errors and retryable statuses are retried
+        until settings.CRAWLER_RETRIES or the retry budget run out"""
+        limiter = self.limiter(url)
+        attempt = 0
+        while True:
+            self.budget.requests += 1
+            yield from limiter.acquire()
+            start = time.monotonic()
+            try:
+                result = yield from send()
+            except (asyncio.TimeoutError, ClientError) as e:
+                limiter.release(time.monotonic() - start, congested=isinstance(e, asyncio.TimeoutError))
+                failure, retry_after = e, None
+            except BaseException:
+                limiter.release(time.monotonic() - start, congested=False)
+                raise
+            else:
+                status, retry_after = result[0], result[1].get(hdrs.RETRY_AFTER)
+                limiter.release(time.monotonic() - start, congested=status in RETRY_STATUSES)
+                if status not in RETRY_STATUSES:
+                    return result
+                failure = 'HTTP {:d}'.format(status)
+
+            if attempt >= settings.CRAWLER_RETRIES or not self.budget.spend():
+                self.counters['failed'] += 1
+                raise CrawlError(url, failure)
+            delay = self.backoff(attempt, retry_after)
+            self.counters['retried'] += 1
+            log.debug('{} failed ({!r}), retrying in {:.2f}s (limit {:.1f})'.format(url, failure, delay, limiter.limit))
+            attempt += 1
+            yield from asyncio.sleep(delay, loop=self.loop)
+
+    def log_stats(self):
+        log.info('rate limiter: {retried} retries, {failed} failed, concurrency limits {limits}'.format(
+            limits=', '.join('{} {:.1f}'.format(host, limiter.limit) for host, limiter in sorted(self.hosts.items())),
+            **{k: self.counters[k] for k in ('retried', 'failed')}))
+        self.counters.clear()
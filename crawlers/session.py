@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+import settings
+from aiohttp import ClientSession, TCPConnector, hdrs
+from .cache import CacheEntry, HttpCache, content_hash
+from .ratelimit import RateLimiter
+
+log = logging.getLogger(settings.LOGGER_HIDDENSTREET)
+
+
+class CountingConnector(TCPConnector):
+    """TCP connector keeping track of how many connections were opened
+    versus how many requests were served by an already pooled one"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+        self.created = 0
+
+    @property
+    def reused(self) -> int:
+        return self.acquired - self.created
+
+    @asyncio.coroutine
+    def connect(self, req):
+        self.acquired += 1
+        return (yield from super().connect(req))
+
+    @asyncio.coroutine
+    def _create_connection(self, req):
+        self.created += 1
+        return (yield from super()._create_connection(req))
+
+
+class CrawlerSession:
+    """Long lived HTTP session shared by every request of the crawler.
+
+    Connections are kept alive in a pool (with a per host cap), so DNS
+    lookups and TCP/TLS handshakes are paid once per pooled connection
+    instead of once per crawled page. Requests go through an adaptive per
+    host rate limiter which retries them when they fail. When a cache is
+    given, requests are made conditional on the validators of the cached
+    copy."""
+
+    headers = {
+        hdrs.ACCEPT_ENCODING: 'gzip, deflate',
+        hdrs.USER_AGENT: 'ironbot (+https://github.com/Zerrossetto/ironbot)'
+    }
+
+    def __init__(self, loop, cache: HttpCache=None):
+        self.cache = cache
+        self.connector = CountingConnector(limit=settings.CRAWLER_POOL_SIZE,
+                                           limit_per_host=settings.CRAWLER_POOL_PER_HOST,
+                                           keepalive_timeout=settings.CRAWLER_KEEPALIVE_TIMEOUT,
+                                           loop=loop)
+        self.client = ClientSession(connector=self.connector, headers=self.headers, loop=loop)
+        self.limiter = RateLimiter(loop)
+
+    @asyncio.coroutine
+    def get(self, url: str, m: str='get', parser: str=None):
+        """Fetches url, returning the response status, the decoded body (None if status is not 200) and,
+        when the page is known to be unchanged, the rows the given parser extracted from it last time.
+        The body is not loaded from the cache when cached rows are returned."""
+        entry = None if self.cache is None else self.cache.lookup(url)
+        rows = None if entry is None else entry.rows_for(parser)
+        if entry is not None and self.cache.is_fresh(entry):
+            body = None if rows is not None else self.cache.body(entry)
+            if rows is not None or body is not None:
+                log.debug('({}) cache hit for url {}'.format(m, url))
+                self.cache.counters['hit'] += 1
+                return 200, body, rows
+            entry = None
+
+        status, headers, page = yield from self.limiter.request(
+            url, lambda: self._send(url, entry.conditional_headers() if entry else None, m))
+
+        if entry is not None and status == 304:
+            body = None if rows is not None else self.cache.body(entry)
+            if rows is not None or body is not None:
+                self.cache.counters['revalidated'] += 1
+                entry.stored = time.time()
+                self.cache.store(entry)
+                return 200, body, rows
+            # the cached body is gone, the page is fetched again without validators
+            entry = rows = None
+            status, headers, page = yield from self.limiter.request(url, lambda: self._send(url, None, m))
+
+        if self.cache is not None and status == 200:
+            digest = content_hash(page)
+            validators = dict(etag=headers.get(hdrs.ETAG), last_modified=headers.get(hdrs.LAST_MODIFIED))
+            if entry is not None and entry.sha256 == digest:
+                # no validators or a server ignoring them, but the content is the same
+                self.cache.counters['revalidated'] += 1
+                entry.stored = time.time()
+                entry.etag, entry.last_modified = validators['etag'], validators['last_modified']
+                self.cache.store(entry)
+                return status, page, rows
+            self.cache.counters['miss'] += 1
+            self.cache.store(CacheEntry(url, sha256=digest, stored=time.time(), **validators), page)
+
+        return status, page, None
+
+    @asyncio.coroutine
+    def _send(self, url: str, headers: dict, m: str):
+        page = None
+        log.debug('({}) client {}: connecting to url {}'.format(m, id(self.client), url))
+        response = yield from self.client.get(url, headers=headers, timeout=settings.CRAWLER_REQUEST_TIMEOUT)
+        try:
+            log.debug('({}) client {}: got {:d} ({}) for url {}'.format(
+                m, id(self.client), response.status, response.headers.get(hdrs.CONTENT_ENCODING, 'identity'), url))
+            if response.status == 200:
+                page = yield from response.text()
+        finally:
+            response.release()
+        return response.status, response.headers, page
+
+    def stats(self) -> tuple:
+        return self.connector.acquired, self.connector.created, self.connector.reused
+
+    def log_stats(self, since: tuple=(0, 0, 0)):
+        acquired, created, reused = [now - before for now, before in zip(self.stats(), since)]
+        log.info('http pool: {} requests, {} new connections, {} reused'.format(acquired, created, reused))
+        self.limiter.log_stats()
+
+    def close(self):
+        if not self.client.closed:
+            self.log_stats()
+            self.client.close()
@@ -120,6 +120,15 @@ class MonsterLevelType(UrlElement):
     def related_model(cls):
         return Monster
 
+    @classmethod
+    def for_server(cls, server):
+        if server == Server.BEFORE_BIG_BANG:
+            excluded = (cls.LEVEL_101_TO_120, cls.LEVEL_121_TO_140, cls.LEVEL_141_TO_160,
+                        cls.LEVEL_161_TO_180, cls.LEVEL_181_TO_200)
+        else:
+            excluded = (cls.LEVEL_101_TO_150, cls.LEVEL_151_TO_200)
+        return [lvl for lvl in cls if lvl not in excluded]
+
 
 class Section(UrlElement):
 
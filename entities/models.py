@@ -1,7 +1,48 @@
+import datetime
+import functools
+import logging
 import peewee
-from inspect import getmembers
+import re
+import settings
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional
+from .records import record_type
+
+log = logging.getLogger(settings.LOGGER_IRONBOT)
+
+# bump whenever a model changes, snapshots built with another schema are rebuilt from scratch
+SCHEMA_VERSION = 7
+
+sqlite_db = peewee.Proxy()
+
+
+def open_database(path: str) -> peewee.SqliteDatabase:
+    """Opens the SQLite database at path (':memory:' for a throwaway one), models use it once sqlite_db is
+    initialized with it (see DataStore) or within bind()"""
+    pragmas = [('cache_size', -16 * 1024),  # in KiB
+               ('temp_store', 'memory')]
+    if path != ':memory:':
+        pragmas += [('journal_mode', 'wal'),
+                    ('synchronous', 'normal'),
+                    ('mmap_size', 256 * 1024 * 1024)]
+    # a single connection, shared by the threads using the database one at a time (see HiddenStreet.on_db_thread)
+    return peewee.SqliteDatabase(path, pragmas=pragmas, threadlocals=False, check_same_thread=False)
+
+
+@contextmanager
+def bind(db, models):
+    """Points models to db for the duration of the block. Same as peewee.Using,
+    but queries run on the current connection of db instead of a new one"""
+    previous = [model._meta.database for model in models]
+    for model in models:
+        model._meta.database = db
+    try:
+        yield db
+    finally:
+        for model, database in zip(models, previous):
+            model._meta.database = database
 
-sqlite_db = peewee.SqliteDatabase(':memory:')
 
 class BaseModel(peewee.Model):
     class Meta:
@@ -9,11 +50,22 @@ class BaseModel(peewee.Model):
 
     @property
     def to_dict(self):
-        fields = getmembers(type(self), lambda m: issubclass(type(m), peewee.Field))
-        return {key: getattr(self, key) for key, value in fields}
+        return {name: getattr(self, name) for name in self._meta.fields}
+
+
+class CrawledModel(BaseModel):
+    """Rows coming from the hidden-street crawler, upserted by their server and hiddenstreet_alias.
+    Rows which disappear from the site are kept as tombstones (deleted = True)"""
+    server = peewee.TextField()
+    hiddenstreet_alias = peewee.TextField()
+    content_hash = peewee.CharField(max_length=40, null=True)
+    deleted = peewee.BooleanField(default=False, index=True)
+
+    class Meta:
+        indexes = ((('server', 'hiddenstreet_alias'), True),)
 
 
-class Weapon(BaseModel):
+class Weapon(CrawledModel):
     id_weapon = peewee.PrimaryKeyField()
     name = peewee.TextField()
     weapon_type = peewee.TextField()
@@ -21,7 +73,7 @@ class Weapon(BaseModel):
     required_stats = peewee.TextField(null=True)
     weapon_attack = peewee.IntegerField(null=True)
     attack_speed = peewee.TextField(null=True)
-    job = peewee.TextField()
+    job = peewee.TextField(null=True)
     effects = peewee.TextField(null=True)
     available_upgrades = peewee.IntegerField(null=True)
     sold_for = peewee.IntegerField()
@@ -31,9 +83,8 @@ class Weapon(BaseModel):
     remarks = peewee.TextField(null=True)
 
 
-class Monster(BaseModel):
+class Monster(CrawledModel):
     id_monster = peewee.PrimaryKeyField()
-    hiddenstreet_alias = peewee.TextField(unique=True)
     image_url = peewee.TextField(null=True)
     name = peewee.TextField()
     level = peewee.IntegerField(null=True)
@@ -74,19 +125,140 @@ class Monster(BaseModel):
 
 
 class MapleWeapon(BaseModel):
+    """Loaded from the compiled catalogue, see crawlers/mapleweapons.py"""
     id_weapon = peewee.PrimaryKeyField()
     name = peewee.TextField()
     weapon_type = peewee.TextField()
-    required_level = peewee.TextField(null=True)
+    required_level = peewee.IntegerField(index=True)
     required_stats = peewee.TextField(null=True)
-    weapon_attack = peewee.TextField(null=True)
-    magic_attack = peewee.TextField(null=True)
-    attack_speed = peewee.TextField(null=True)
-    job = peewee.TextField()
+    weapon_attack = peewee.IntegerField(null=True)
+    magic_attack = peewee.IntegerField(null=True)
+    attack_speed = peewee.IntegerField(null=True)
+    job = peewee.TextField(null=True)
     effects = peewee.TextField(null=True)
-    available_upgrades = peewee.TextField(null=True)
-    sold_for = peewee.TextField()
+    available_upgrades = peewee.IntegerField(null=True)
+    sold_for = peewee.IntegerField()
     description = peewee.TextField(null=True)
     dropped_by = peewee.TextField(null=True)
     available_from = peewee.TextField(null=True)
-    remarks = peewee.TextField(null=True)
\ No newline at end of file
+    remarks = peewee.TextField(null=True)
+
+
+class DataGeneration(BaseModel):
+    """One row per refresh of the crawled data, the latest completed one tells how old a snapshot is"""
+    generation = peewee.PrimaryKeyField()
+    schema_version = peewee.IntegerField()
+    started = peewee.DateTimeField(default=datetime.datetime.utcnow)
+    completed = peewee.DateTimeField(null=True)
+    errors = peewee.IntegerField(default=0)
+    failed = peewee.BooleanField(default=False)
+
+    @classmethod
+    def latest(cls):
+        return (cls.select()
+                .where(cls.completed.is_null(False) & (cls.failed == False))
+                .order_by(cls.generation.desc())
+                .first())
+
+
+# name columns with an FTS5 index, as <table>_fts external content tables kept in sync by triggers.
+# Tombstoned rows are left out of the index
+SEARCHABLE = (Monster, Weapon, MapleWeapon)
+
+_words = re.compile(r'\w+')
+
+
+@functools.lru_cache(maxsize=None)
+def fts_tokenizer() -> Optional[str]:
+    """FTS5 tokenizer of the name indexes for the SQLite library in use, None when it has no FTS5"""
+    db = sqlite3.connect(':memory:')
+    try:
+        fts5 = db.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0]
+    finally:
+        db.close()
+    if not fts5:
+        log.warn('SQLite {} has no FTS5, names are searched with LIKE'.format(sqlite3.sqlite_version))
+        return None
+    if sqlite3.sqlite_version_info < (3, 27):
+        log.warn('SQLite {} cannot remove every diacritic (3.27 and later do), names are indexed with '
+                 'remove_diacritics 1'.format(sqlite3.sqlite_version))
+        return 'unicode61 remove_diacritics 1'
+    return 'unicode61 remove_diacritics 2'
+
+
+def _fts_statements(model) -> list:
+    table = model._meta.db_table
+    pk = model._meta.primary_key.db_column
+    alive = '{}.deleted = 0' if 'deleted' in model._meta.fields else '1'
+    fmt = dict(fts='{}_fts'.format(table), table=table, pk=pk, tokenizer=fts_tokenizer(),
+               new_alive=alive.format('new'), old_alive=alive.format('old'))
+    return [s.format(**fmt) for s in (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        "name, content='{table}', content_rowid='{pk}', tokenize='{tokenizer}', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} WHEN {new_alive} BEGIN "
+        "INSERT INTO {fts}(rowid, name) VALUES (new.{pk}, new.name); END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} WHEN {old_alive} BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.{pk}, old.name); END",
+        # a single trigger, the old entry has to go before the new one is added
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, name) SELECT 'delete', old.{pk}, old.name WHERE {old_alive}; "
+        "INSERT INTO {fts}(rowid, name) SELECT new.{pk}, new.name WHERE {new_alive}; END")]
+
+
+def create_search_indexes(db, models):
+    if fts_tokenizer() is None:
+        return
+    for model in models:
+        if model in SEARCHABLE:
+            for statement in _fts_statements(model):
+                db.execute_sql(statement)
+
+
+def drop_search_indexes(db, models):
+    if fts_tokenizer() is None:
+        return
+    for model in models:
+        if model in SEARCHABLE:
+            fts = '{}_fts'.format(model._meta.db_table)
+            for trigger in ('ai', 'ad', 'au'):
+                db.execute_sql('DROP TRIGGER IF EXISTS {}_{}'.format(fts, trigger))
+            db.execute_sql('DROP TABLE IF EXISTS {}'.format(fts))
+
+
+def match_expression(text: str):
+    """FTS5 query matching names holding every word of text, each one as a prefix (None without words)"""
+    words = _words.findall(text)
+    return ' '.join('"{}"*'.format(word) for word in words) if words else None
+
+
+def search(model, text: str, where: str='', params: tuple=(), limit: int=None) -> list:
+    """Records (see records.py) of the rows of model whose name matches every word of text, best bm25
+    rank first. where is an extra SQL condition on the model table (aliased t), taking params.
+    Without FTS5, names having a word starting with every word of text are found with LIKE, shortest first"""
+    words = _words.findall(text)
+    if not words:
+        return []
+    rtype = record_type(model)
+    table = model._meta.db_table
+    if fts_tokenizer() is not None:
+        fts = '{}_fts'.format(table)
+        source = '{fts} JOIN {table} AS t ON t.{pk} = {fts}.rowid'.format(
+            fts=fts, table=table, pk=model._meta.primary_key.db_column)
+        conditions = ['{} MATCH ?'.format(fts)]
+        args = [match_expression(text)]
+        order = 'bm25({}), t.name'.format(fts)
+    else:
+        source = '{} AS t'.format(table)
+        conditions = ["(' ' || t.name) LIKE ? ESCAPE '\\'"] * len(words)
+        args = ['% {}%'.format(word.replace('_', '\\_')) for word in words]
+        if 'deleted' in model._meta.fields:
+            conditions.append('t.deleted = 0')
+        order = 'length(t.name), t.name'
+    if where:
+        conditions.append('({})'.format(where))
+
+    sql = 'SELECT {columns} FROM {source} WHERE {conditions} ORDER BY {order}{limit}'.format(
+        columns=', '.join('t.{}'.format(field.db_column) for field in rtype.columns),
+        source=source, conditions=' AND '.join(conditions), order=order,
+        limit=' LIMIT {:d}'.format(limit) if limit else '')
+    return list(map(rtype._make, model._meta.database.execute_sql(sql, tuple(args) + tuple(params))))
@@ -0,0 +1,40 @@
+"""Read only records of model rows.
+
+Queries answering commands only read their results, so instead of model
+instances (a dict of data plus dirty tracking per row) they return
+namedtuples, made straight out of the rows of the SQLite cursor. The
+record type of a model and its column list are built once.
+"""
+from collections import namedtuple
+
+_types = {}
+
+
+def record_type(model):
+    """namedtuple type holding a row of model, with the fields in model._meta.sorted_fields order"""
+    rtype = _types.get(model)
+    if rtype is None:
+        fields = model._meta.sorted_field_names
+        base = namedtuple('{}Record'.format(model.__name__), fields)
+        pk = model._meta.primary_key.name
+        rtype = type(base.__name__, (base,), dict(
+            __slots__=(),
+            model=model,
+            columns=tuple(model._meta.sorted_fields),
+            pk=property(lambda self: getattr(self, pk)),
+            to_dict=property(lambda self: self._asdict())))
+        _types[model] = rtype
+    return rtype
+
+
+def records(query, model=None) -> list:
+    """Rows of a select query on the columns of model (query.model_class by default) as records.
+    Values are the ones of the SQLite driver, without the conversions of the model fields"""
+    model = model or query.model_class
+    rtype = record_type(model)
+    return list(map(rtype._make, query.database.execute_sql(*query.select(*rtype.columns).sql())))
+
+
+def as_record(instance):
+    rtype = record_type(type(instance))
+    return rtype._make(getattr(instance, name) for name in rtype._fields)
@@ -0,0 +1,141 @@
+import logging
+import os
+import peewee
+import settings
+from contextlib import contextmanager
+from .models import bind, create_search_indexes, drop_search_indexes, open_database, sqlite_db, DataGeneration, \
+    SCHEMA_VERSION
+
+log = logging.getLogger(settings.LOGGER_IRONBOT)
+
+
+class Slot:
+    """One of the two databases of a DataStore, with the readers currently using it"""
+
+    __slots__ = ('path', 'db', 'generation', 'readers', 'retired', 'derived')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self.generation = None
+        self.readers = 0
+        self.retired = False
+        self.derived = {}
+
+    def __repr__(self):
+        return '<Slot {} generation={}>'.format(self.path, self.generation.generation if self.generation else None)
+
+
+def slot_paths(path: str) -> tuple:
+    if path == ':memory:':
+        return path, path
+    root, ext = os.path.splitext(path)
+    return path, '{}.b{}'.format(root, ext)
+
+
+class DataStore:
+    """Double buffered database.
+
+    Readers go through the live slot (the one the models proxy points to),
+    while a refresh builds the next generation in the shadow slot. swap()
+    switches readers to the new generation in a single step, and the old
+    one is closed as soon as the queries still running on it are done."""
+
+    def __init__(self, path: str, models: list, on_open=None):
+        self.models = models + [DataGeneration]
+        self.on_open = on_open
+        self.slots = [Slot(p) for p in slot_paths(path)]
+        for slot in self.slots:
+            self.open(slot)
+        latest = max(self.slots, key=lambda s: (s.generation.generation if s.generation else 0))
+        self.live_index = self.slots.index(latest)
+        sqlite_db.initialize(self.live.db)
+        if self.shadow.path == ':memory:':
+            self.release(self.shadow)
+
+    @property
+    def live(self) -> Slot:
+        return self.slots[self.live_index]
+
+    @property
+    def shadow(self) -> Slot:
+        return self.slots[1 - self.live_index]
+
+    def open(self, slot: Slot) -> Slot:
+        if slot.db is None:
+            slot.db = open_database(slot.path)
+            slot.retired = False
+            with bind(slot.db, self.models):
+                slot.db.create_tables([DataGeneration], safe=True)
+                last = DataGeneration.select().order_by(DataGeneration.generation.desc()).first()
+                if last is not None and last.schema_version != SCHEMA_VERSION:
+                    log.info('{} has schema version {}, rebuilding it for {}'.format(
+                        slot.path, last.schema_version, SCHEMA_VERSION))
+                    drop_search_indexes(slot.db, self.models)
+                    slot.db.drop_tables(self.models, safe=True)
+                slot.db.create_tables(self.models, safe=True)
+                create_search_indexes(slot.db, self.models)
+                slot.generation = DataGeneration.latest()
+                if self.on_open is not None:
+                    self.on_open(slot)
+        return slot
+
+    def open_shadow(self) -> Slot:
+        return self.open(self.shadow)
+
+    def next_generation(self) -> int:
+        """Above every generation of the open slots, failed and unfinished ones included, whose rows stay"""
+        latest = 0
+        for slot in self.slots:
+            if slot.db is not None:
+                with bind(slot.db, [DataGeneration]):
+                    latest = max(latest, DataGeneration.select(peewee.fn.MAX(DataGeneration.generation)).scalar() or 0)
+            elif slot.generation is not None:
+                latest = max(latest, slot.generation.generation)
+        return latest + 1
+
+    def swap(self):
+        old = self.live
+        self.live_index = 1 - self.live_index
+        sqlite_db.initialize(self.live.db)
+        old.retired = True
+        log.info('switched to generation {} in {}'.format(self.live.generation.generation, self.live.path))
+        if old.readers == 0:
+            self.release(old)
+
+    @contextmanager
+    def reading(self):
+        """Pins the live slot for the duration of the block, results must be fully fetched inside it"""
+        slot = self.live
+        slot.readers += 1
+        try:
+            yield slot
+        finally:
+            slot.readers -= 1
+            if slot.retired and slot.readers == 0:
+                self.release(slot)
+
+    def derived(self, name: str, build):
+        """What build(slot) computes out of the live slot, built once per generation. Not kept while the
+        first generation is being ingested, as rows keep coming in"""
+        with self.reading() as slot:
+            if slot.generation is None:
+                return build(slot)
+            generation, value = slot.derived.get(name, (None, None))
+            if generation != slot.generation.generation:
+                value = build(slot)
+                slot.derived[name] = slot.generation.generation, value
+            return value
+
+    def release(self, slot: Slot):
+        slot.derived.clear()
+        if slot.db is not None:
+            slot.db.close()
+            slot.db = None
+            if slot.path == ':memory:':
+                slot.generation = None
+            log.debug('released {}'.format(slot))
+
+    def close(self):
+        for slot in self.slots:
+            self.release(slot)
@@ -1,7 +1,11 @@
 import asyncio
 import logging.config
+import math
+import time
 import settings
 from commons import messages, errors, utils
+from commons.outbox import Outbox
+from commons.throttle import Throttle, Throttled
 from discord import DiscordException
 from discord.ext.commands import Bot, Context
 
@@ -10,6 +14,7 @@ log = logging.getLogger(settings.LOGGER_IRONBOT)
 
 def main():
 
+    started = time.monotonic()
     logging.config.dictConfig(settings.LOGGING)
     log.info('Starting application')
     messages.initialize()
@@ -18,6 +23,7 @@ def main():
     log.info('i18n tables loaded. Available languages are [{}]'.format(', '.join(messages.msg_map.keys())))
 
     ironbot = Bot(**settings.BOT)
+    ironbot.add_check(Throttle())
 
     for ext in ('cogs.basic', 'cogs.maple'):
         try:
@@ -30,6 +36,7 @@ def main():
     def on_ready():
 
         log.info('Logged in as {} id={}'.format(ironbot.user.name, ironbot.user.id))
+        log.info('Startup to ready took {:.2f}s'.format(time.monotonic() - started))
 
     @ironbot.event
     @asyncio.coroutine
@@ -40,9 +47,14 @@ def main():
     @asyncio.coroutine
     def on_command_error(error: DiscordException, ctx: Context):
         k = (type(error), type(ctx.message.channel), ctx.command.name)
-        if k in errors.handled:
+        if isinstance(error, Throttled):
+            log.debug('Throttled {}: {}'.format(ctx.message.author, error))
+            if error.notify:
+                Outbox.of(ctx.bot).put(ctx.message.channel, messages.get('error.throttled').format(
+                    ctx.message.author, math.ceil(error.retry_after)))
+        elif k in errors.handled:
             log.debug('Handled command error: {}'.format(error))
-            yield from ctx.bot.send_message(ctx.message.channel, errors.get(*k))
+            Outbox.of(ctx.bot).put(ctx.message.channel, errors.get(*k))
         else:
             log.warn('Unhandled command error: {}'.format(error))
 
@@ -19,11 +19,60 @@ BOT = {
 SET_SERVER_START_DEFAULT = os.getenv('SET_SERVER_START_DEFAULT', None)
 SCHEDULER_FREQUENCY = 0.5  # time in seconds
 HEARTBEAT_FILE = os.getenv('HEARTBEAT_FILE', '/tmp/ironbot-heartbeat')
+OUTBOX_RATE = 5  # messages sent to a channel every OUTBOX_PER seconds, as Discord allows
+OUTBOX_PER = 5  # time in seconds
+OUTBOX_GLOBAL_RATE = 50  # messages sent per second, all channels together
+THROTTLE_USER_RATE = int(os.getenv('THROTTLE_USER_RATE', 5))  # commands of a user every THROTTLE_USER_PER seconds
+THROTTLE_USER_PER = int(os.getenv('THROTTLE_USER_PER', 10))  # time in seconds
+# commands in a server every THROTTLE_SERVER_PER seconds
+THROTTLE_SERVER_RATE = int(os.getenv('THROTTLE_SERVER_RATE', 30))
+THROTTLE_SERVER_PER = int(os.getenv('THROTTLE_SERVER_PER', 60))  # time in seconds
+THROTTLE_MAX_BUCKETS = 1024  # users or servers tracked before the idle ones are dropped
 
 '''
 Parsing Section
 '''
 BF4_PARSER = 'lxml'
+PARSER_BACKEND = os.getenv('PARSER_BACKEND', 'bs4')  # 'bs4' (BeautifulSoup, using BF4_PARSER), 'lxml' or 'compiled'
+PARSER_PROCESSES = int(os.getenv('PARSER_PROCESSES', os.cpu_count() or 1))  # 0 parses on the event loop
+
+
+'''
+Crawler Section
+'''
+HIDDENSTREET_URL = os.getenv('HIDDENSTREET_URL', 'https://www.hidden-street.net')
+HIDDENSTREET_BBB_URL = os.getenv('HIDDENSTREET_BBB_URL', 'http://bbb.hidden-street.net')
+CRAWLER_POOL_SIZE = int(os.getenv('CRAWLER_POOL_SIZE', 20))  # total pooled connections
+CRAWLER_POOL_PER_HOST = int(os.getenv('CRAWLER_POOL_PER_HOST', 5))
+CRAWLER_KEEPALIVE_TIMEOUT = 30  # time in seconds
+CRAWLER_QUEUE_SIZE = 10  # max items waiting between two pipeline stages
+CRAWL_SERVERS = [s for s in os.getenv('CRAWL_SERVERS', '').split(',') if s]  # e.g. 'bbb,gms', every server if empty
+DEFAULT_SERVER = os.getenv('DEFAULT_SERVER', 'bbb')  # server answering the monster commands
+EXP_RATE = int(os.getenv('EXP_RATE', 4))  # multiplies the monster EXP in replies
+CRAWLER_INITIAL_CONCURRENCY = int(os.getenv('CRAWLER_INITIAL_CONCURRENCY', 2))  # requests in flight per host
+CRAWLER_TARGET_LATENCY = float(os.getenv('CRAWLER_TARGET_LATENCY', 2))  # slower responses reduce concurrency
+CRAWLER_REQUEST_TIMEOUT = int(os.getenv('CRAWLER_REQUEST_TIMEOUT', 20))  # time in seconds
+CRAWLER_RETRIES = int(os.getenv('CRAWLER_RETRIES', 4))
+CRAWLER_RETRY_BUDGET = float(os.getenv('CRAWLER_RETRY_BUDGET', 0.1))  # max retries per request, on top of the above
+CRAWLER_BACKOFF_BASE = 0.5  # time in seconds before the first retry, doubled at each one
+CRAWLER_BACKOFF_MAX = 30  # time in seconds
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join(PROJECT_ROOT, 'crawlers', '.cache'))
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 60))  # time in seconds a page is used without revalidation
+
+
+'''
+Database Section
+'''
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(PROJECT_ROOT, 'ironbot.sqlite3'))  # or ':memory:'
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', 24 * 60 * 60))  # time in seconds before data is crawled again
+DATA_REFRESH_INTERVAL = int(os.getenv('DATA_REFRESH_INTERVAL', 6 * 60 * 60))  # time in seconds between refreshes
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 1024))  # query results kept, 0 disables the cache
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 60 * 60))  # time in seconds
+FUZZY_SUGGESTIONS = 5  # names suggested when a lookup finds nothing
+FUZZY_AUTOCORRECT = 0.75  # similarity (0 to 1) over which the closest name is answered straight away
+COMPLETIONS = 10  # names listed by the complete command, per kind
+RANKING_SIZE = 10  # monsters listed by the ranking commands
 
 
 '''
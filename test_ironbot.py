@@ -1,7 +1,492 @@
+import asyncio
+import os
+import tempfile
+import time
 import unittest
+import settings
+from collections import deque
+from types import SimpleNamespace
+from unittest import mock
+from bench import parsers
+from bench.standin import StandIn
+from discord.ext.commands import Bot, Context
+from discord.ext.commands.core import inject_context
+from commons import messages
+from cogs.basic import Basic
+from commons.outbox import Outbox, pack
+from commons.throttle import single_flight, Throttle, Throttled
+from commons.replies import Replies
+from crawlers.cache import CacheEntry, HttpCache
+from crawlers.hiddenstreet import HiddenStreet, plan_crawl
+from crawlers.ingest import Ingestor
+from crawlers.mapleweapons import Catalogue, compile_catalogue
+from crawlers.names import PrefixIndex, TrigramIndex
+from crawlers.querycache import QueryCache
+from crawlers.ranking import MonsterTable
+from crawlers.ratelimit import CrawlError, RateLimiter
+from entities.enums import Server, WeaponType
+from entities.models import bind, create_search_indexes, open_database, search, sqlite_db, DataGeneration, Monster, \
+    Weapon
+from entities.records import as_record
+from entities.store import DataStore
 
 
 class IronBotTests(unittest.TestCase):
 
     def empty_test(self):
         assert True, 'Always pass'
+
+
+class ParserTests(unittest.TestCase):
+
+    def test_backends_give_identical_rows(self):
+        self.assertEqual(parsers.check_identical(parsers.load_corpus(), sorted(parsers.backends)), [])
+
+
+class HttpCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(self.tmp.name, max_bytes=2500)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rows_are_bound_to_parser(self):
+        self.cache.store(CacheEntry('http://a', sha256='x', stored=time.time()), '<html></html>')
+        self.cache.store_rows('http://a', [{'name': 'Snail'}], 'lxml')
+        entry = self.cache.lookup('http://a')
+        self.assertEqual(entry.rows_for('lxml'), [{'name': 'Snail'}])
+        self.assertIsNone(entry.rows_for('html.parser'))
+
+    def test_missing_body_is_a_miss(self):
+        entry = CacheEntry('http://a', sha256='x', stored=time.time())
+        self.cache.store(entry, '<html></html>')
+        os.remove(self.cache._paths(self.cache.key('http://a'))[1])
+        self.assertIsNone(self.cache.body(entry))
+        self.cache.store(entry, '<html></html>')
+        os.remove(self.cache._paths(self.cache.key('http://a'))[1])
+        self.assertIsNone(self.cache.lookup('http://a'))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_least_recently_used_is_evicted(self):
+        for url in ('http://a', 'http://b'):
+            self.cache.store(CacheEntry(url, stored=time.time()), 'x' * 1000)
+            time.sleep(0.01)
+        self.cache.lookup('http://a')
+        self.cache.store(CacheEntry('http://c', stored=time.time()), 'x' * 1000)
+        self.assertIsNone(self.cache.lookup('http://b'))
+        self.assertIsNotNone(self.cache.lookup('http://a'))
+        self.assertLessEqual(self.cache.size, 2500)
+
+
+class IngestorTests(unittest.TestCase):
+
+    def setUp(self):
+        sqlite_db.initialize(open_database(':memory:'))
+        sqlite_db.create_tables([Monster])
+
+    @staticmethod
+    def rows(*names):
+        return [dict(server='bbb', hiddenstreet_alias=name.lower(), name=name, level=len(name)) for name in names]
+
+    def test_upsert_and_tombstone(self):
+        Ingestor(sqlite_db).ingest(Monster, self.rows('Snail', 'Pig', 'Yeti'))
+
+        ingestor = Ingestor(sqlite_db)
+        rows = self.rows('Snail', 'Pig', 'Zakum')
+        rows[1]['level'] = 7
+        ingestor.ingest(Monster, rows)
+        ingestor.tombstone(Monster, {'bbb'})
+
+        self.assertEqual(ingestor.counters, dict(inserted=1, updated=1, unchanged=1, deleted=1))
+        self.assertEqual(Monster.get(Monster.hiddenstreet_alias == 'pig').level, 7)
+        self.assertTrue(Monster.get(Monster.hiddenstreet_alias == 'yeti').deleted)
+
+    def test_tombstone_only_crawled_servers(self):
+        rows = self.rows('Snail', 'Pig')
+        Ingestor(sqlite_db).ingest(Monster, rows + [dict(row, server='gms') for row in rows])
+
+        ingestor = Ingestor(sqlite_db)
+        ingestor.ingest(Monster, self.rows('Snail'))
+        ingestor.tombstone(Monster, {'bbb'})
+
+        self.assertEqual(ingestor.counters['deleted'], 1)
+        self.assertEqual(Monster.select().where((Monster.server == 'gms') & (Monster.deleted == False)).count(), 2)
+
+    def test_same_alias_on_other_servers(self):
+        ingestor = Ingestor(sqlite_db)
+        ingestor.ingest(Monster, self.rows('Snail') + [dict(row, server='gms') for row in self.rows('Snail')])
+        self.assertEqual(ingestor.counters['inserted'], 2)
+
+
+class SearchTests(unittest.TestCase):
+
+    def setUp(self):
+        sqlite_db.initialize(open_database(':memory:'))
+        sqlite_db.create_tables([Monster])
+        create_search_indexes(sqlite_db, [Monster])
+
+    def test_ranked_prefix_match_follows_ingest(self):
+        self.check_search()
+
+    @mock.patch('entities.models.fts_tokenizer', return_value=None)
+    def test_like_without_fts5(self, _):
+        sqlite_db.initialize(open_database(':memory:'))
+        sqlite_db.create_tables([Monster])
+        create_search_indexes(sqlite_db, [Monster])
+        self.assertEqual(sqlite_db.get_tables(), ['monster'])
+        self.check_search()
+
+    def check_search(self):
+        Ingestor(sqlite_db).ingest(Monster, IngestorTests.rows('Blue Snail', 'Snail', 'Red Snail', 'Pig'))
+        self.assertEqual([m.name for m in search(Monster, 'snail')][0], 'Snail')
+        self.assertEqual([m.name for m in search(Monster, 'blu sna')], ['Blue Snail'])
+        self.assertEqual(search(Monster, '"*'), [])
+
+        ingestor = Ingestor(sqlite_db)
+        rows = IngestorTests.rows('Blue Snail', 'Snail', 'Pig')
+        rows[0]['name'] = 'Green Snail'
+        ingestor.ingest(Monster, rows)
+        ingestor.tombstone(Monster, {'bbb'})
+        self.assertEqual(sorted(m.name for m in search(Monster, 'snail')), ['Green Snail', 'Snail'])
+
+
+class TrigramIndexTests(unittest.TestCase):
+
+    def test_misspelled_names(self):
+        index = TrigramIndex(['Zakum', 'Zakum Arm', 'Horntail', 'Snail', 'Blue Snail'])
+        self.assertEqual(index.similar('zakkum', 1)[0][0], 'Zakum')
+        self.assertEqual(index.similar('horntial', 1)[0][0], 'Horntail')
+        self.assertEqual(index.similar('!!'), [])
+
+
+class PrefixIndexTests(unittest.TestCase):
+
+    def test_complete_any_word(self):
+        index = PrefixIndex([('Maple Claw', 43), ('Maple Golden Claw', 64), ('Zakum', 50), ('Claw Bat', None)])
+        self.assertEqual(index.complete('cla'), ['Maple Claw', 'Maple Golden Claw', 'Claw Bat'])
+        self.assertEqual(index.complete('map cl'), ['Maple Claw'])
+        self.assertEqual(index.complete('zak', 1), ['Zakum'])
+        self.assertEqual(index.complete(''), [])
+
+
+class CatalogueTests(unittest.TestCase):
+
+    def test_compiled_catalogue_matches_csv(self):
+        catalogue = Catalogue.load()
+        self.assertEqual(dict(columns=catalogue.columns, rows=catalogue.rows), compile_catalogue())
+
+    def test_levels(self):
+        catalogue = Catalogue.load()
+        self.assertEqual([names.required_level for names in catalogue.levels()], [35, 43, 64, 77])
+        self.assertEqual([names.required_level for names in catalogue.levels(40, 70)], [43, 64])
+        self.assertTrue(catalogue.levels(35)[0].names.startswith('Maple Sword, Maple Staff'))
+        self.assertEqual(catalogue.levels(36), [])
+
+
+class MonsterTableTests(unittest.TestCase):
+
+    def test_rank_within_level_window(self):
+        table = MonsterTable([('Snail', 1, 8, 3, 5, 0, 0, 10, 20),
+                              ('Pig', 7, 70, 10, 30, 5, 5, 20, 10),
+                              ('Ribbon Pig', 10, 120, 25, 40, 8, 5, 20, 10),
+                              ('Mystery', 9, None, 40, None, None, None, None, None)])
+        self.assertEqual([m.name for m in table.rank('exp')], ['Snail', 'Ribbon Pig', 'Pig'])
+        self.assertEqual([m.name for m in table.rank('exp', 5, 9, k=1)], ['Pig'])
+        self.assertAlmostEqual(table.rank('mesos', 10, 10)[0].score, 40 / 120)
+        self.assertEqual(table.rank('exp', 100), [])
+
+
+class QueryCacheTests(unittest.TestCase):
+
+    def test_lru_by_generation(self):
+        cache = QueryCache(max_entries=2, ttl=60)
+        calls = []
+
+        def query(name):
+            calls.append(name)
+            return [name]
+
+        for key in ('zakum', 'pig', 'zakum'):
+            cache.get(key, 1, lambda: query(key))
+        self.assertEqual(calls, ['zakum', 'pig'])
+        cache.get('snail', 1, lambda: query('snail'))  # evicts pig
+        cache.get('pig', 1, lambda: query('pig'))
+        cache.get('zakum', 2, lambda: query('zakum'))
+        cache.get('zakum', None, lambda: query('zakum'))
+        self.assertEqual(calls, ['zakum', 'pig', 'snail', 'pig', 'zakum', 'zakum'])
+        self.assertEqual(cache.stats()['hit_ratio'], 0.167)
+        self.assertGreater(cache.bytes, 0)
+
+
+class RepliesTests(unittest.TestCase):
+
+    def test_monster_reply_rendered_once(self):
+        messages.initialize()
+        monster = as_record(Monster(id_monster=1, name="Jr. Balrog's Pet", level=50, experience=100,
+                                    health_points=3000))
+        replies = Replies()
+        reply = replies.get(monster, messages.DEFAULT_LANG)
+        self.assertIn('**EXP** {}'.format(100 * settings.EXP_RATE), reply)
+        self.assertIn('/monster/jr.-balrogs-pet', reply)
+        self.assertIs(replies.get(monster._replace(), messages.DEFAULT_LANG), reply)
+        self.assertNotEqual(replies.get(monster._replace(experience=1), messages.DEFAULT_LANG), reply)
+
+
+class OutboxTests(unittest.TestCase):
+
+    def test_pack(self):
+        pending = deque(['a' * 5, 'b' * 4, 'c' * 3])
+        self.assertEqual(pack(pending, limit=10), 'aaaaa\nbbbb')
+        self.assertEqual(pack(pending, limit=10), 'ccc')
+        pending = deque(['line one\nline two', 'x'])
+        self.assertEqual(pack(pending, limit=12), 'line one')
+        self.assertEqual(list(pending), ['line two', 'x'])
+
+    def test_coalesces_and_paces(self):
+        loop = asyncio.new_event_loop()
+        sent = []
+
+        @asyncio.coroutine
+        def send(destination, content):
+            sent.append((destination, content, loop.time()))
+
+        outbox = Outbox(send, loop, limit=20, rate=2, per=0.2)
+        for i in range(8):
+            outbox.put('general', 'reply {}'.format(i))
+        outbox.put('trade', 'hello')
+        start = loop.time()
+        loop.run_until_complete(outbox.flush())
+        loop.close()
+
+        general = [(content, at) for destination, content, at in sent if destination == 'general']
+        self.assertEqual([content for content, _ in general], ['reply 0\nreply 1', 'reply 2\nreply 3',
+                                                               'reply 4\nreply 5', 'reply 6\nreply 7'])
+        self.assertGreater(general[-1][1] - start, 0.15)  # two messages, then one every 0.1s
+        self.assertIn(('trade', 'hello'), [(d, c) for d, c, _ in sent])
+        self.assertEqual(outbox.workers, {})
+
+
+class ThrottleTests(unittest.TestCase):
+
+    def context(self, user: str, server: str=None, **attrs):
+        message = SimpleNamespace(author=SimpleNamespace(id=user), server=server and SimpleNamespace(id=server),
+                                  channel=user)
+        return Context(prefix='!', message=message, **attrs)
+
+    @mock.patch.multiple(settings, THROTTLE_USER_RATE=2, THROTTLE_USER_PER=10, THROTTLE_SERVER_RATE=3,
+                         THROTTLE_SERVER_PER=10)
+    def test_user_and_server_buckets(self):
+        now = [0.0]
+        throttle = Throttle(clock=lambda: now[0])
+        self.assertTrue(throttle(self.context('a', 'guild')))
+        self.assertTrue(throttle(self.context('a', 'guild')))
+        with self.assertRaises(Throttled) as first:
+            throttle(self.context('a', 'guild'))
+        with self.assertRaises(Throttled) as second:
+            throttle(self.context('a', 'guild'))
+        self.assertTrue(first.exception.notify)
+        self.assertFalse(second.exception.notify)
+        self.assertAlmostEqual(first.exception.retry_after, 5)
+        self.assertTrue(throttle(self.context('b', 'guild')))
+        with self.assertRaises(Throttled):
+            throttle(self.context('c', 'guild'))
+        self.assertTrue(throttle(self.context('c')))
+        now[0] = 5
+        self.assertTrue(throttle(self.context('a', 'guild')))
+
+    @mock.patch.multiple(settings, THROTTLE_USER_RATE=1, THROTTLE_USER_PER=10, THROTTLE_MAX_BUCKETS=4)
+    def test_warned_users_are_forgotten(self):
+        now = [0.0]
+        throttle = Throttle(clock=lambda: now[0])
+        for i, user in enumerate('abcdefgh'):
+            now[0] = i * 5
+            throttle(self.context(user))
+            with self.assertRaises(Throttled):
+                throttle(self.context(user))
+        self.assertLessEqual(len(throttle.warned), 4)
+        self.assertLessEqual(len(throttle.users), 4)
+
+    @mock.patch.multiple(settings, THROTTLE_USER_RATE=2, THROTTLE_USER_PER=10)
+    def test_help_costs_one_command(self):
+        loop = asyncio.new_event_loop()
+        bot = Bot(command_prefix='!', loop=loop)
+        bot.connection.user = SimpleNamespace(mention='@ironbot', name='ironbot')
+        bot.add_cog(Basic(bot))
+        throttle = Throttle(clock=lambda: 0.0)
+        bot.add_check(throttle)
+
+        ctx = self.context('a', 'guild', bot=bot, command=bot.commands['help'], invoked_with='help')
+        self.assertTrue(bot.can_run(ctx))
+        pages = bot.formatter.format_help_for(ctx, bot)
+        loop.run_until_complete(bot.http.close())
+        loop.close()
+        for name in ('help', 'roll', 'choose', 'repeat', 'cool'):
+            self.assertIn('  {} '.format(name), '\n'.join(pages))
+        self.assertEqual(throttle.users['a'].tokens, 1)
+        self.assertEqual(throttle.servers['guild'].tokens, settings.THROTTLE_SERVER_RATE - 1)
+
+    def test_single_flight(self):
+        loop = asyncio.new_event_loop()
+        runs = []
+
+        class Cog:
+            b = mock.Mock(loop=loop)
+
+            @single_flight
+            @asyncio.coroutine
+            def command(self, *words):
+                runs.append(words)
+                yield from asyncio.sleep(0.01, loop=loop)
+
+        def invoke(channel, *words):
+            return inject_context(self.context(channel), Cog().command)(*words)
+
+        loop.run_until_complete(asyncio.gather(invoke('general', 'Horntail'), invoke('general', ' horntail'),
+                                               invoke('trade', 'horntail'), invoke('general', 'zakum'), loop=loop))
+        loop.run_until_complete(invoke('general', 'horntail'))
+        loop.close()
+        # the two horntail in general at the same time ran once
+        self.assertEqual(sorted(' '.join(words).strip().lower() for words in runs),
+                         ['horntail', 'horntail', 'horntail', 'zakum'])
+        self.assertEqual(Cog.command.in_flight, {})
+
+
+class DataStoreTests(unittest.TestCase):
+
+    def test_swap_waits_for_readers(self):
+        store = DataStore(':memory:', [Monster])
+        old = store.live
+        Ingestor(old.db).ingest(Monster, IngestorTests.rows('Snail'))
+
+        shadow = store.open_shadow()
+        Ingestor(shadow.db).ingest(Monster, IngestorTests.rows('Snail', 'Pig'))
+        with bind(shadow.db, [DataGeneration]):
+            shadow.generation = DataGeneration.create(generation=store.next_generation(), schema_version=0)
+
+        with store.reading():
+            store.swap()
+            self.assertIsNotNone(old.db)
+        self.assertIsNone(old.db)
+        with store.reading():
+            self.assertEqual(Monster.select().count(), 2)
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.limiter = RateLimiter(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def send(self, *statuses):
+        statuses = list(statuses)
+
+        @asyncio.coroutine
+        def send():
+            return statuses.pop(0), {'Retry-After': '0'}, None
+        return send
+
+    def test_retries_until_success(self):
+        status, _, _ = self.loop.run_until_complete(self.limiter.request('http://host/a', self.send(503, 502, 200)))
+        self.assertEqual(status, 200)
+        self.assertEqual(self.limiter.counters['retried'], 2)
+
+    def test_aimd(self):
+        limiter = self.limiter.limiter('http://host/a')
+        for _ in range(3):
+            self.loop.run_until_complete(limiter.acquire())
+            limiter.release(latency=0.01, congested=False)
+        self.assertGreater(limiter.limit, 3)
+        self.loop.run_until_complete(limiter.acquire())
+        limiter.release(latency=0.01, congested=True)
+        self.assertLess(limiter.limit, 2)
+
+    def test_gives_up(self):
+        with self.assertRaises(CrawlError):
+            self.loop.run_until_complete(self.limiter.request('http://host/a', self.send(*[429] * 10)))
+
+
+class OfflineCrawlTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.standin = StandIn(self.loop, pages=2, seed=0)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.standin.close())
+        self.loop.close()
+        self.tmp.cleanup()
+
+    def test_refresh(self):
+        urls = self.loop.run_until_complete(self.standin.start())
+        with mock.patch.multiple(settings, CRAWL_SERVERS=['bbb', 'gms'], PARSER_BACKEND='lxml', PARSER_PROCESSES=0,
+                                 DATABASE_PATH=':memory:', HTTP_CACHE_DIR=self.tmp.name):
+            with mock.patch.multiple(HiddenStreet, base_url=urls[0], base_url_bbb=urls[1]):
+                hiddenstreet = HiddenStreet(self.loop)
+                self.loop.run_until_complete(hiddenstreet.refresh())
+                with hiddenstreet.store.reading():
+                    weapons = Weapon.select().where(Weapon.server == 'gms').count()
+                generation = hiddenstreet.generation
+                staffs = self.loop.run_until_complete(hiddenstreet.maple_weapon_by_name_async('maple', 'staff'))
+                hiddenstreet.close()
+
+        self.assertEqual(generation.errors, 0)
+        targets = plan_crawl([Server.BEFORE_BIG_BANG, Server.GLOBAL])
+        self.assertEqual(hiddenstreet.pipeline.counters['ingest'], 2 * len(targets))
+        self.assertEqual(weapons, len(WeaponType) * 2 * 20)
+        self.assertEqual(staffs[0].name, 'Maple Staff')
+
+    def test_partial_crawl_keeps_live_generation(self):
+        urls = self.loop.run_until_complete(self.standin.start())
+        with mock.patch.multiple(settings, CRAWL_SERVERS=['bbb'], PARSER_BACKEND='lxml', PARSER_PROCESSES=0,
+                                 DATABASE_PATH=':memory:', HTTP_CACHE_DIR=self.tmp.name):
+            with mock.patch.multiple(HiddenStreet, base_url=urls[0], base_url_bbb=urls[1]):
+                hiddenstreet = HiddenStreet(self.loop)
+                self.loop.run_until_complete(hiddenstreet.refresh())
+                generation = hiddenstreet.generation
+                with hiddenstreet.store.reading():
+                    monsters = Monster.select().count()
+
+                parse = hiddenstreet._parse
+
+                @asyncio.coroutine
+                def failing(item):
+                    if item[0].page > 0:
+                        raise ValueError('broken page')
+                    return (yield from parse(item))
+
+                hiddenstreet._parse = failing
+                self.loop.run_until_complete(hiddenstreet.refresh())
+                with hiddenstreet.store.reading():
+                    self.assertEqual(Monster.select().count(), monsters)
+                self.assertIs(hiddenstreet.generation, generation)
+                self.assertIsNone(hiddenstreet.store.shadow.db)
+                hiddenstreet.close()
+
+    def test_refresh_after_failed_crawl(self):
+        urls = self.loop.run_until_complete(self.standin.start())
+        database = os.path.join(self.tmp.name, 'ironbot.db')
+        with mock.patch.multiple(settings, CRAWL_SERVERS=['bbb'], PARSER_BACKEND='lxml', PARSER_PROCESSES=0,
+                                 DATABASE_PATH=database, HTTP_CACHE_DIR=self.tmp.name):
+            with mock.patch.multiple(HiddenStreet, base_url=urls[0], base_url_bbb=urls[1]):
+                hiddenstreet = HiddenStreet(self.loop)
+
+                @asyncio.coroutine
+                def failing(item):
+                    raise ValueError('broken page')
+
+                hiddenstreet._parse = failing
+                self.loop.run_until_complete(hiddenstreet.refresh())
+                self.assertIsNone(hiddenstreet.generation)
+                self.assertFalse(hiddenstreet.ready)
+
+                del hiddenstreet._parse
+                self.loop.run_until_complete(hiddenstreet.refresh())
+                self.assertEqual(hiddenstreet.generation.generation, 2)
+                self.assertTrue(hiddenstreet.ready)
+                hiddenstreet.close()